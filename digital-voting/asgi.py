@@ -0,0 +1,29 @@
+"""
+ASGI config for digital-voting project.
+
+It exposes the ASGI callable as a module-level variable named ``application``
+and serves the student voting views in their async versions. Streaming
+responses (the EC's exports and live results) are pulled in threads of their
+own; see institution/handlers.py.
+
+For more information on this file, see
+https://docs.djangoproject.com/en/3.1/howto/deployment/asgi/
+"""
+
+import os
+
+import django
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "digital-voting.settings")
+os.environ.setdefault("DIGITAL_VOTING_ASYNC_VIEWS", "1")
+
+# As django.core.asgi.get_asgi_application(), with the project's handler.
+django.setup(set_prefix=False)
+
+from institution.handlers import ASGIHandler  # noqa: E402
+application = ASGIHandler()
+
+# Starts the password hashing pool (settings.LOGIN_HASHING_WORKERS), if any,
+# before the first logins arrive.
+from institution import hashers  # noqa: E402
+hashers.start()
@@ -46,8 +46,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'institution.middleware.RequestStatsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'institution.middleware.StaticFilesMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'institution.middleware.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
@@ -75,8 +78,25 @@ TEMPLATES = [
     },
 ]
 
+# Parse every template once per process instead of on every render. Django
+# does this by itself when DEBUG is off; DIGITAL_VOTING_CACHED_TEMPLATES=1
+# turns it on with DEBUG too. Template edits then need a restart.
+CACHED_TEMPLATES = not DEBUG or os.environ.get('DIGITAL_VOTING_CACHED_TEMPLATES') == '1'
+if CACHED_TEMPLATES:
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
 WSGI_APPLICATION = 'digital-voting.wsgi.application'
 
+# asgi.py switches the student voting views to their async versions
+# (institution/views/students_async.py).
+ASYNC_STUDENT_VIEWS = os.environ.get('DIGITAL_VOTING_ASYNC_VIEWS') == '1'
+
 
 # Database
 # https://docs.djangoproject.com/en/2.0/ref/settings/#databases
@@ -88,6 +108,64 @@ DATABASES = {
     }
 }
 
+# SQLite tuning. 'production' switches to write-ahead logging so that readers
+# no longer wait for writers, waits up to five seconds for a lock instead of
+# failing, fsyncs only at checkpoints (safe in WAL mode), and keeps
+# connections open across requests. The pragmas are applied to every new
+# connection by institution.signals.configure_sqlite. WAL mode is stored in
+# the database file and outlives a switch back to 'default'.
+SQLITE_PROFILES = {
+    'default': {
+        'PRAGMAS': {},
+        'CONN_MAX_AGE': 0,
+    },
+    'production': {
+        'PRAGMAS': {
+            'journal_mode': 'WAL',
+            'synchronous': 'NORMAL',
+            'busy_timeout': 5000,
+            'cache_size': -16000,
+            'temp_store': 'MEMORY',
+        },
+        'CONN_MAX_AGE': 600,
+    },
+}
+SQLITE_PROFILE = os.environ.get('DIGITAL_VOTING_SQLITE_PROFILE', 'default')
+SQLITE_PRAGMAS = SQLITE_PROFILES[SQLITE_PROFILE]['PRAGMAS']
+DATABASES['default']['CONN_MAX_AGE'] = SQLITE_PROFILES[SQLITE_PROFILE]['CONN_MAX_AGE']
+
+# Read replica. Point DIGITAL_VOTING_REPLICA_DB at a copy of the database
+# (kept fresh by your replication, or locally by `manage.py sync_replica`)
+# and the results and listing pages read from it (institution/routers.py).
+if os.environ.get('DIGITAL_VOTING_REPLICA_DB'):
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ['DIGITAL_VOTING_REPLICA_DB'],
+        'CONN_MAX_AGE': DATABASES['default']['CONN_MAX_AGE'],
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['institution.routers.ReplicaRouter']
+
+# Seconds the replica may lag behind the primary. A session reads from the
+# primary for this long after it writes, and caches filled from the replica
+# expire after it.
+REPLICA_MAX_LAG = 5
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.1/topics/cache/
+# The local-memory cache is per process. When running several worker
+# processes switch to a shared backend (e.g. FileBasedCache) so that ballot
+# invalidations reach every worker.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'digital-voting',
+    }
+}
+
 
 # Internationalization
 # https://docs.djangoproject.com/en/2.0/topics/i18n/
@@ -112,14 +190,77 @@ STATICFILES_DIRS = [
     os.path.join(BASE_DIR, 'static'),
 ]
 
+# `manage.py collectstatic` writes content-hashed copies of the static files
+# here, with .gz/.br siblings (institution/storage.py). Templates link the
+# hashed names when DEBUG is off.
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+STATICFILES_STORAGE = 'institution.storage.CompressedManifestStaticFilesStorage'
+
+# Serve STATIC_ROOT from Django itself (institution.middleware.
+# StaticFilesMiddleware) when nothing in front of it does. Hashed files are
+# cached for a year; the rest for STATIC_MAX_AGE seconds.
+SERVE_STATIC = os.environ.get('DIGITAL_VOTING_SERVE_STATIC') == '1'
+STATIC_MAX_AGE = 60 * 60
+
 MEDIA_ROOT =  os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Candidate mugshots are shown on the ballot as squares of this many CSS
+# pixels. Thumbnails are rendered at 1x and 2x, in WebP and JPEG at
+# MUGSHOT_QUALITY (institution/mugshots.py).
+MUGSHOT_SIZE = 96
+MUGSHOT_QUALITY = 80
+
 
 # Custom Django auth settings
 
 AUTH_USER_MODEL = 'institution.User'
 
+# With CACHED_AUTH, sessions and the logged-in user's profile (the User,
+# their Student and faculties; institution/profiles.py) are read from the
+# cache instead of the database on every request. Only turn it on with a
+# cache shared by every server process (Memcached, Redis): with the default
+# per-process cache, a logout or password change in one process goes unseen
+# by the others. ModelBackend stays listed so sessions that were logged in
+# through it keep working.
+CACHED_AUTH_SETTINGS = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+    'AUTHENTICATION_BACKENDS': [
+        'institution.profiles.ProfileBackend',
+        'django.contrib.auth.backends.ModelBackend',
+    ],
+}
+CACHED_AUTH = os.environ.get('DIGITAL_VOTING_CACHED_AUTH') == '1'
+if CACHED_AUTH:
+    SESSION_ENGINE = CACHED_AUTH_SETTINGS['SESSION_ENGINE']
+    AUTHENTICATION_BACKENDS = CACHED_AUTH_SETTINGS['AUTHENTICATION_BACKENDS']
+
+# Seconds a user's profile stays cached. Changes drop it immediately.
+PROFILE_CACHE_TIMEOUT = 15 * 60
+
+# Passwords are hashed with the first of PASSWORD_HASHERS, with
+# PASSWORD_ITERATIONS PBKDF2 iterations, and rehashed on their owner's next
+# login when either has changed (institution/hashers.py). That rehash costs
+# one more hash, so change them well before polling day. Fewer iterations
+# make logins cheaper and stolen hashes cheaper to crack.
+PASSWORD_HASHERS = [
+    'institution.hashers.PBKDF2PasswordHasher',
+    'django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher',
+    'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+]
+PASSWORD_ITERATIONS = int(os.environ.get('DIGITAL_VOTING_PASSWORD_ITERATIONS', 216000))
+
+# Processes each web process hashes passwords in, so logins don't tie up its
+# request threads; 0 hashes on the request thread. Compare with bench_logins.
+LOGIN_HASHING_WORKERS = int(os.environ.get('DIGITAL_VOTING_LOGIN_HASHING_WORKERS', 0))
+
+# With VOTING_TOKENS, students can also vote through a link carrying a signed
+# per-election token (institution/tokens.py, mint_voting_tokens) instead of
+# logging in. Change VOTING_TOKEN_SALT to revoke every token minted so far.
+VOTING_TOKENS = os.environ.get('DIGITAL_VOTING_VOTING_TOKENS') == '1'
+VOTING_TOKEN_SALT = 'institution.tokens'
+
 LOGIN_URL = 'login'
 
 LOGOUT_URL = 'logout'
@@ -140,6 +281,90 @@ MESSAGE_TAGS = {
 }
 
 
+# Voting
+
+# 'full' puts every position of an election on one ballot that is submitted
+# once; 'wizard' asks for one position per request.
+BALLOT_MODE = 'full'
+
+# Seconds a ballot snapshot stays cached. Edits invalidate it immediately;
+# the timeout only bounds memory for elections nobody is voting in.
+BALLOT_CACHE_TIMEOUT = 60 * 60
+
+# Seconds the rendered ballot forms and election list rows stay cached. They
+# are keyed on the ballot version, so edits show up immediately. 0 renders
+# them on every request.
+FRAGMENT_CACHE_TIMEOUT = 60 * 60
+
+# Seconds each student's list of open elections stays cached. Votes, faculty
+# changes and EC edits invalidate it immediately.
+OPEN_ELECTIONS_CACHE_TIMEOUT = 60 * 60
+
+# Seconds the record of which positions a student has voted for in an
+# election stays cached (institution/progress.py). Votes update it as they
+# commit.
+BALLOT_PROGRESS_CACHE_TIMEOUT = 60 * 60
+
+# 'direct' saves every ballot in its own transaction. 'journal' appends full
+# ballots to a file in VOTE_JOURNAL_DIR and one writer per host saves them in
+# batches, which keeps voters off SQLite's write lock (institution/journal.py).
+# Wizard steps are always saved directly.
+VOTE_INGESTION = 'direct'
+VOTE_JOURNAL_DIR = os.path.join(BASE_DIR, 'vote-journal')
+
+# Most ballots saved per transaction.
+VOTE_JOURNAL_BATCH_SIZE = 200
+
+# Seconds between passes of `manage.py drain_vote_journal --watch`.
+VOTE_JOURNAL_INTERVAL = 1
+
+# Seconds a voter waits for their ballot to be saved before being told it
+# was received and will be counted shortly.
+VOTE_JOURNAL_CONFIRM_TIMEOUT = 5
+
+
+# Where `manage.py archive_election` writes the raw votes of archived
+# elections (institution/archive.py). Keep it backed up: the rows are
+# deleted from the database.
+ELECTION_ARCHIVE_DIR = os.path.join(BASE_DIR, 'election-archives')
+
+# Key of the vote ledger's HMAC chain (institution/ledger.py). Keep it out of
+# the database and its backups: whoever has both can rewrite the chain. It
+# must not change while the ledger is kept, or no entry verifies any more.
+LEDGER_KEY = os.environ.get('DIGITAL_VOTING_LEDGER_KEY', SECRET_KEY)
+
+
+# Live results stream (ec:election_results_live)
+
+# Seconds between pushes of changed tallies to watching EC officers.
+LIVE_RESULTS_INTERVAL = 1
+
+# Seconds between re-reads of each watched election's totals from the
+# database. Also how quickly votes cast in other processes show up.
+LIVE_RESULTS_RESYNC = 30
+
+# Seconds between keep-alive comments on an idle stream.
+LIVE_RESULTS_HEARTBEAT = 15
+
+
+# Request statistics (institution.middleware.RequestStatsMiddleware)
+
+# Per-view query counts and DB/template/wall times. Off by default; cheap
+# enough to leave on in production.
+REQUEST_STATS = False
+
+# Minutes of history kept in each process's rolling histograms.
+REQUEST_STATS_WINDOW = 15
+
+# Each process writes its histograms here every REQUEST_STATS_FLUSH_INTERVAL
+# seconds for `manage.py dump_request_stats` and the EC stats page.
+REQUEST_STATS_DIR = os.path.join(BASE_DIR, 'request-stats')
+REQUEST_STATS_FLUSH_INTERVAL = 30
+
+# Fraction of requests (0-1) for which every query's SQL and stack is kept.
+REQUEST_STATS_SAMPLE_RATE = 0
+
+
 # Third party apps configuration
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
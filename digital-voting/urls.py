@@ -1,6 +1,7 @@
+from django.conf import settings
 from django.urls import include, path
 
-from institution.views import institution, students, ec
+from institution.views import institution, students, students_async, ec
 
 urlpatterns = [
     path('', include('institution.urls')),
@@ -9,3 +10,7 @@ urlpatterns = [
     path('accounts/signup/student/', students.StudentSignUpView.as_view(), name='student_signup'),
     path('accounts/signup/ec/', ec.ECOfficerSignUpView.as_view(), name='ec_signup'),
 ]
+
+if settings.ASYNC_STUDENT_VIEWS:
+    # Ahead of django.contrib.auth.urls' login.
+    urlpatterns.insert(0, path('accounts/login/', students_async.login, name='login'))
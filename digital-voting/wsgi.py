@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "digital-voting.settings")
 
 application = get_wsgi_application()
+
+# Starts the password hashing pool (settings.LOGIN_HASHING_WORKERS), if any,
+# before the first logins arrive.
+from institution import hashers  # noqa: E402
+hashers.start()
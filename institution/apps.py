@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class InstitutionConfig(AppConfig):
     name = 'institution'
+
+    def ready(self):
+        from . import signals  # noqa: F401
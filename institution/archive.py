@@ -0,0 +1,197 @@
+'''
+Archiving finished elections.
+
+Every StudentVote and VotedElection row of a finished election still sits
+in the indexes that live votes walk. Archiving an election closes it for
+voting, freezes its tallies into an ElectionArchive record and moves the raw
+rows to a gzipped NDJSON file in settings.ELECTION_ARCHIVE_DIR. The
+candidate tallies and turnout counts stay in the database, so the results
+page keeps working. The file's SHA-256 is stored on the record and checked
+when the rows are restored for an audit.
+
+An archive file holds one JSON object per line:
+
+    {"type": "election", "id", "name", "faculty", "archived_at", "voters", "votes", "tallies"}
+    {"type": "voter", "student", "student_number", "date"}    one per VotedElection
+    {"type": "vote", "student", "candidate", "position"}      one per StudentVote
+'''
+import gzip
+import hashlib
+import json
+import os
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import Case, Count, DateTimeField, Value, When
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from . import journal
+from .models import Candidate, CandidateTally, ElectionArchive, StudentVote, VotedElection
+
+ARCHIVE_CHUNK_SIZE = 2000
+
+
+class ArchiveError(Exception):
+    pass
+
+
+def archive_path(election_id):
+    return os.path.join(settings.ELECTION_ARCHIVE_DIR, 'election-%d.ndjson.gz' % election_id)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def freeze_tallies(election):
+    '''
+    The final tallies, counted from the raw votes. Running tallies that
+    drifted from them are corrected.
+    '''
+    counts = dict(StudentVote.objects.filter(election=election)
+                  .values_list('candidate').annotate(votes=Count('pk')).order_by())
+    tallies = {tally.candidate_id: tally for tally in CandidateTally.objects.filter(election=election)}
+    drifted = []
+    for candidate_id, tally in tallies.items():
+        if tally.count != counts.get(candidate_id, 0):
+            tally.count = counts.get(candidate_id, 0)
+            drifted.append(tally)
+    CandidateTally.objects.bulk_update(drifted, ['count'])
+
+    candidates = Candidate.objects.filter(position__election=election) \
+        .select_related('position') \
+        .order_by('position__text', 'position', 'full_name')
+    rows = [{
+        'position': candidate.position.text,
+        'candidate': candidate.full_name,
+        'candidate_id': candidate.pk,
+        'votes': counts.get(candidate.pk, 0),
+    } for candidate in candidates]
+    # Leader first within each position, as on the results page.
+    return sorted(rows, key=lambda row: (row['position'], -row['votes']))
+
+
+def write_lines(f, records):
+    for record in records:
+        f.write(json.dumps(record, cls=DjangoJSONEncoder).encode() + b'\n')
+
+
+def archive_election(election):
+    '''
+    Archives the election's raw votes and deletes them from the live tables.
+    Returns the ElectionArchive.
+    '''
+    if any(entry.election_id == election.pk for entry in journal.backlog()):
+        raise ArchiveError('Ballots for %s are still waiting in the vote journal; drain it first.' % election)
+    if not election.archived:
+        election.archived = True
+        election.save(update_fields=['archived'])
+
+    voted_elections = VotedElection.objects.filter(election=election)
+    votes = StudentVote.objects.filter(election=election)
+    path = archive_path(election.pk)
+    os.makedirs(settings.ELECTION_ARCHIVE_DIR, exist_ok=True)
+    try:
+        return write_archive(election, voted_elections, votes, path)
+    finally:
+        if os.path.exists(path + '.tmp'):
+            os.remove(path + '.tmp')
+
+
+def write_archive(election, voted_elections, votes, path):
+    with transaction.atomic():
+        archived_at = timezone.now()
+        tallies = freeze_tallies(election)
+        voter_count, vote_count = voted_elections.count(), votes.count()
+        with open(path + '.tmp', 'wb') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb', mtime=0) as f:
+                write_lines(f, [{
+                    'type': 'election', 'id': election.pk, 'name': election.name, 'faculty': election.faculty_id,
+                    'archived_at': archived_at, 'voters': voter_count, 'votes': vote_count, 'tallies': tallies,
+                }])
+                # isoformat() keeps the microseconds that DjangoJSONEncoder drops.
+                write_lines(f, (
+                    {'type': 'voter', 'student': student_id, 'student_number': student_number,
+                     'date': date.isoformat()}
+                    for student_id, student_number, date in voted_elections.order_by('pk')
+                    .values_list('student', 'student__student_number', 'date')
+                    .iterator(chunk_size=ARCHIVE_CHUNK_SIZE)
+                ))
+                write_lines(f, (
+                    {'type': 'vote', 'student': student_id, 'candidate': candidate_id, 'position': position_id}
+                    for student_id, candidate_id, position_id in votes.order_by('pk')
+                    .values_list('student', 'candidate', 'position')
+                    .iterator(chunk_size=ARCHIVE_CHUNK_SIZE)
+                ))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+        # A vote that slipped in after the counts were taken would be
+        # deleted without having been archived. Nothing refers to these
+        # rows, so each delete is a single DELETE statement.
+        deleted_votes, _ = votes.delete()
+        deleted_voters, _ = voted_elections.delete()
+        if (deleted_voters, deleted_votes) != (voter_count, vote_count):
+            raise ArchiveError('Votes for %s were still arriving while it was archived; try again.' % election)
+
+        archive, _ = ElectionArchive.objects.update_or_create(election=election, defaults={
+            'archived_at': archived_at,
+            'path': os.path.basename(path),
+            'sha256': file_sha256(path + '.tmp'),
+            'voters': voter_count,
+            'votes': vote_count,
+            'tallies': tallies,
+        })
+        os.replace(path + '.tmp', path)
+    return archive
+
+
+def read_archive(archive):
+    '''
+    Yields the records of the archive's file after checking it against the
+    stored SHA-256.
+    '''
+    path = os.path.join(settings.ELECTION_ARCHIVE_DIR, archive.path)
+    if file_sha256(path) != archive.sha256:
+        raise ArchiveError('%s does not match the SHA-256 recorded when it was archived.' % path)
+    with gzip.open(path, 'rb') as f:
+        for line in f:
+            yield json.loads(line)
+
+
+@transaction.atomic
+def restore_election(archive):
+    '''
+    Puts the archived rows back into the live tables, e.g. for an audit. The
+    election stays closed for voting; archive it again to drop the rows.
+    Returns (voters, votes) restored.
+    '''
+    election = archive.election
+    if VotedElection.objects.filter(election=election).exists() or \
+            StudentVote.objects.filter(election=election).exists():
+        raise ArchiveError('%s already has votes in the database; archive it again before restoring.' % election)
+    dates, votes = {}, []
+    for record in read_archive(archive):
+        if record['type'] == 'voter':
+            dates[record['student']] = parse_datetime(record['date'])
+        elif record['type'] == 'vote':
+            votes.append(StudentVote(student_id=record['student'], candidate_id=record['candidate'],
+                                     position_id=record['position'], election=election))
+    VotedElection.objects.bulk_create([
+        VotedElection(student_id=student_id, election=election) for student_id in dates
+    ], batch_size=500)
+    # auto_now_add stamped every row with now; put the archived dates back.
+    student_ids = list(dates)
+    for i in range(0, len(student_ids), 500):
+        chunk = student_ids[i:i + 500]
+        VotedElection.objects.filter(election=election, student__in=chunk).update(date=Case(
+            *[When(student=student_id, then=Value(dates[student_id])) for student_id in chunk],
+            output_field=DateTimeField()))
+    StudentVote.objects.bulk_create(votes, batch_size=500)
+    return len(dates), len(votes)
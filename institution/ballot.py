@@ -0,0 +1,90 @@
+'''
+Cached, read-only snapshot of an election's ballot.
+
+Positions and candidates do not change while students are voting, so the
+vote pages read them from the cache instead of the positions/candidates
+tables. The snapshot is rebuilt lazily after an EC officer edits the
+election (see signals.py).
+'''
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Prefetch
+
+from .models import Candidate, Position
+from .mugshots import get_thumbnails
+from .routers import cache_timeout, reading_from_replica
+
+Ballot = namedtuple('Ballot', ['election_id', 'version', 'positions'])
+BallotPosition = namedtuple('BallotPosition', ['pk', 'text', 'candidates'])
+BallotCandidate = namedtuple('BallotCandidate', ['pk', 'position_id', 'full_name', 'thumbnails'])
+
+
+def _version_key(election_id):
+    return 'ballot:%d:version' % election_id
+
+
+def get_ballot_version(election_id):
+    key = _version_key(election_id)
+    version = cache.get(key)
+    if version is None:
+        # Start from the clock rather than 1 so a version evicted from the
+        # cache is never reused for a different snapshot.
+        version = int(time.time() * 1000)
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def get_ballot_versions(election_ids):
+    keys = {_version_key(election_id): election_id for election_id in election_ids}
+    versions = cache.get_many(keys)
+    for key in keys.keys() - versions.keys():
+        versions[key] = get_ballot_version(keys[key])
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_ballot(election_id):
+    try:
+        cache.incr(_version_key(election_id))
+    except ValueError:
+        get_ballot_version(election_id)
+
+
+def build_ballot(election_id, version):
+    candidates = Candidate.objects.order_by('full_name')
+    positions = Position.objects.filter(election_id=election_id) \
+        .order_by('text', 'pk') \
+        .prefetch_related(Prefetch('candidates', queryset=candidates))
+    return Ballot(election_id, version, [
+        BallotPosition(position.pk, position.text, [
+            BallotCandidate(
+                candidate.pk,
+                candidate.position_id,
+                candidate.full_name,
+                get_thumbnails(candidate.mugshot_digest))
+            for candidate in position.candidates.all()
+        ])
+        for position in positions
+    ])
+
+
+def get_ballot(election_id):
+    '''
+    The ballot snapshot. A snapshot read from the replica may list
+    candidates the EC has just removed, so it is cached apart from the
+    primary's and only used for reads from the replica.
+    '''
+    version = get_ballot_version(election_id)
+    keys = ['ballot:%d:%d' % (election_id, version)]
+    if reading_from_replica():
+        keys.append('ballot:%d:%d:replica' % (election_id, version))
+    cached = cache.get_many(keys)
+    for key in keys:
+        if key in cached:
+            return cached[key]
+    ballot = build_ballot(election_id, version)
+    cache.set(keys[-1], ballot, cache_timeout(settings.BALLOT_CACHE_TIMEOUT))
+    return ballot
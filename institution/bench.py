@@ -0,0 +1,463 @@
+'''
+Building blocks for the polling-day benchmarks in management/commands/bench_*.
+
+Everything runs against a throwaway SQLite file created next to the real
+database, never against the real database itself. Simulated voters drive the
+actual views through Django's test client, one thread per concurrent voter.
+'''
+import asyncio
+import copy
+import importlib
+import io
+import json
+import os
+import platform
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from importlib import import_module
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.db import close_old_connections, connection, connections
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings
+from django.urls import clear_url_caches, reverse
+
+from . import middleware
+from .models import Candidate, Election, Faculty, Position, Student, User
+
+BENCH_PASSWORD = 'polling-day'
+
+
+@contextmanager
+def temporary_database(path=None):
+    '''
+    Creates and migrates a scratch SQLite database for the duration of the
+    block and points the default connection at it. The file is deleted
+    afterwards, so it must not be the real database or any other existing
+    file.
+    '''
+    if connection.vendor != 'sqlite':
+        raise RuntimeError('The benchmarks run against a scratch SQLite database.')
+    default_path = os.path.join(settings.BASE_DIR, 'bench.sqlite3')
+    path = os.path.abspath(path or default_path)
+    if path == os.path.abspath(str(settings.DATABASES['default']['NAME'])):
+        raise RuntimeError('%s is the real database; give the benchmark a scratch file.' % path)
+    # Only a scratch file left behind by an interrupted run may be replaced.
+    if os.path.exists(path) and path != default_path:
+        raise RuntimeError('%s already exists; the benchmark would delete it.' % path)
+    database = settings.DATABASES['default']
+    old_test = database.setdefault('TEST', {})
+    database['TEST'] = dict(old_test, NAME=path)
+    try:
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    except BaseException:
+        database['TEST'] = old_test
+        raise
+    # A replica reads the scratch database too, as in the test runner.
+    mirrors = {
+        alias: connections[alias].settings_dict['NAME'] for alias in connections
+        if connections[alias].settings_dict.get('TEST', {}).get('MIRROR') == 'default'
+    }
+    for alias in mirrors:
+        connections[alias].close()
+        connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+    cache.clear()
+    try:
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=['testserver']):
+            yield path
+    finally:
+        connections.close_all()
+        for alias, name in mirrors.items():
+            connections[alias].settings_dict['NAME'] = name
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        database['TEST'] = old_test
+
+
+def seed(faculties=2, elections=2, positions=5, candidates=3, students=100):
+    '''
+    Creates an EC officer, `elections` elections per faculty with the given
+    number of positions and candidates, and `students` students spread
+    round-robin over the faculties. Returns the students' usernames.
+    '''
+    owner = User.objects.create_user('bench-ec', password=BENCH_PASSWORD, is_ec_officer=True)
+    faculty_ids = []
+    for f in range(faculties):
+        faculty = Faculty.objects.create(name='Bench %d' % f)
+        faculty_ids.append(faculty.pk)
+        for e in range(elections):
+            election = Election.objects.create(owner=owner, name='Election %d.%d' % (f, e), faculty=faculty)
+            for p in range(positions):
+                position = Position.objects.create(election=election, text='Position %02d' % p)
+                for c in range(candidates):
+                    Candidate.objects.create(position=position, full_name='Candidate %d.%d' % (p, c))
+
+    # Every student shares one hash so seeding doesn't pay for PBKDF2 N times.
+    password = make_password(BENCH_PASSWORD)
+    usernames = ['voter%06d' % i for i in range(students)]
+    User.objects.bulk_create(
+        [User(username=username, password=password, is_student=True) for username in usernames],
+        batch_size=500)
+    user_ids = dict(User.objects.filter(is_student=True).values_list('username', 'pk'))
+    Student.objects.bulk_create(
+        [Student(user_id=user_ids[username], student_number=username.upper()) for username in usernames],
+        batch_size=500)
+    StudentFaculty = Student.faculty.through
+    StudentFaculty.objects.bulk_create([
+        StudentFaculty(student_id=user_ids[username], faculty_id=faculty_ids[i % faculties])
+        for i, username in enumerate(usernames)
+    ], batch_size=500)
+    return usernames
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))]
+
+
+def summarize(samples):
+    '''
+    Aggregates (label, seconds, queries, ok) samples into per-label latency
+    percentiles (in milliseconds) and query counts.
+    '''
+    by_label = defaultdict(list)
+    for sample in samples:
+        by_label[sample[0]].append(sample)
+        by_label['all'].append(sample)
+    summary = {}
+    for label, rows in sorted(by_label.items()):
+        latencies = [seconds * 1000 for _, seconds, _, _ in rows]
+        # Async runs can't attribute queries to requests and record None.
+        queries = [count for _, _, count, _ in rows if count is not None] or [None]
+        summary[label] = {
+            'requests': len(rows),
+            'errors': sum(1 for *_, ok in rows if not ok),
+            'p50_ms': round(percentile(latencies, 50), 2),
+            'p95_ms': round(percentile(latencies, 95), 2),
+            'p99_ms': round(percentile(latencies, 99), 2),
+            'max_ms': round(max(latencies), 2),
+            'queries_per_request': round(sum(queries) / len(queries), 2) if queries != [None] else None,
+            'max_queries': max(queries) if queries != [None] else None,
+        }
+    return summary
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Voter:
+    '''
+    One simulated student: logs in, lists open elections, votes in each of
+    them following settings.BALLOT_MODE and checks the completed list.
+    '''
+
+    def __init__(self, username, ballots, samples, client_class=Client):
+        self.username = username
+        self.ballots = ballots
+        self.samples = samples
+        self.client = client_class()
+        self.counter = QueryCounter()
+
+    def request(self, label, method, url, data=None, expect=200):
+        self.counter.count = 0
+        started = time.perf_counter()
+        try:
+            response = getattr(self.client, method)(url, data or {})
+            ok = response.status_code == expect
+        except Exception:
+            ok = False
+            response = None
+        # The test client keeps connections open; a server closes those
+        # older than CONN_MAX_AGE after every request.
+        close_old_connections()
+        self.samples.append((label, time.perf_counter() - started, self.counter.count, ok))
+        return response
+
+    def vote(self, election_id):
+        url = reverse('students:vote', args=[election_id])
+        positions = self.ballots[election_id]
+        if settings.BALLOT_MODE == 'full':
+            self.request('students:vote GET', 'get', url)
+            self.request('students:vote POST', 'post', url, {
+                'position_%d' % position: random.choice(candidates) for position, candidates in positions
+            }, expect=302)
+        else:
+            for position, candidates in positions:
+                self.request('students:vote GET', 'get', url)
+                self.request('students:vote POST', 'post', url, {'candidate': random.choice(candidates)}, expect=302)
+
+    def run(self, election_ids):
+        with connection.execute_wrapper(self.counter):
+            self.request('login POST', 'post', reverse('login'), {
+                'username': self.username, 'password': BENCH_PASSWORD
+            }, expect=302)
+            self.request('students:election_list', 'get', reverse('students:election_list'))
+            for election_id in election_ids:
+                self.vote(election_id)
+            self.request('students:voted_elections_list', 'get', reverse('students:voted_elections_list'))
+        connection.close()
+
+
+class ResultsReader(Voter):
+    '''
+    The EC officer refreshing the results pages while the polls are open.
+    '''
+
+    def __init__(self, samples, client_class=Client):
+        super().__init__('bench-ec', None, samples, client_class)
+
+    def run(self, election_ids, stop):
+        with connection.execute_wrapper(self.counter):
+            self.request('ec login POST', 'post', reverse('login'), {
+                'username': self.username, 'password': BENCH_PASSWORD
+            }, expect=302)
+            while not stop.is_set():
+                for election_id in election_ids:
+                    self.request('ec:election_results', 'get', reverse('ec:election_results', args=[election_id]))
+        connection.close()
+
+
+class BenchAsyncClient(AsyncClient):
+    '''
+    Django 3.1's AsyncClient hands the request a body stream that refuses
+    the multipart parser's over-long reads, so form POSTs come through
+    empty. ASGI servers pass a spooled file, which this mimics.
+    '''
+
+    def _base_scope(self, **request):
+        scope = super()._base_scope(**request)
+        if '_body_file' in scope:
+            scope['_body_file'] = io.BytesIO(scope['_body_file'].read())
+        return scope
+
+
+class AsyncVoter(Voter):
+    '''
+    Voter for the ASGI path: the same steps through AsyncClient, run as
+    coroutines on one event loop.
+    '''
+
+    def __init__(self, username, ballots, samples, client_class=BenchAsyncClient):
+        super().__init__(username, ballots, samples, client_class)
+
+    async def request(self, label, method, url, data=None, expect=200):
+        started = time.perf_counter()
+        try:
+            response = await getattr(self.client, method)(url, data or {})
+            ok = response.status_code == expect
+        except Exception:
+            ok = False
+            response = None
+        self.samples.append((label, time.perf_counter() - started, None, ok))
+        return response
+
+    async def vote(self, election_id):
+        url = reverse('students:vote', args=[election_id])
+        positions = self.ballots[election_id]
+        if settings.BALLOT_MODE == 'full':
+            await self.request('students:vote GET', 'get', url)
+            await self.request('students:vote POST', 'post', url, {
+                'position_%d' % position: random.choice(candidates) for position, candidates in positions
+            }, expect=302)
+        else:
+            for position, candidates in positions:
+                await self.request('students:vote GET', 'get', url)
+                await self.request('students:vote POST', 'post', url, {
+                    'candidate': random.choice(candidates)
+                }, expect=302)
+
+    async def run(self, election_ids):
+        await self.request('login POST', 'post', reverse('login'), {
+            'username': self.username, 'password': BENCH_PASSWORD
+        }, expect=302)
+        await self.request('students:election_list', 'get', reverse('students:election_list'))
+        for election_id in election_ids:
+            await self.vote(election_id)
+        await self.request('students:voted_elections_list', 'get', reverse('students:voted_elections_list'))
+
+
+def reload_urlconf():
+    importlib.reload(import_module('institution.urls'))
+    importlib.reload(import_module(settings.ROOT_URLCONF))
+    clear_url_caches()
+
+
+@contextmanager
+def async_student_views():
+    '''
+    Serves the student views in their async versions, as asgi.py does.
+    '''
+    try:
+        with override_settings(ASYNC_STUDENT_VIEWS=True):
+            reload_urlconf()
+            yield
+    finally:
+        reload_urlconf()
+
+
+@contextmanager
+def sqlite_profile(name):
+    '''
+    Applies one of settings.SQLITE_PROFILES to the connections opened in
+    the block.
+    '''
+    profile = settings.SQLITE_PROFILES[name]
+    database = settings.DATABASES['default']
+    old_max_age = database['CONN_MAX_AGE']
+    connections.close_all()
+    try:
+        with override_settings(SQLITE_PROFILE=name, SQLITE_PRAGMAS=profile['PRAGMAS']):
+            database['CONN_MAX_AGE'] = profile['CONN_MAX_AGE']
+            yield profile
+    finally:
+        database['CONN_MAX_AGE'] = old_max_age
+        connections.close_all()
+
+
+def template_settings(cached):
+    '''
+    settings.TEMPLATES with the cached template loader on or off.
+    '''
+    templates = copy.deepcopy(settings.TEMPLATES)
+    loaders = ['django.template.loaders.filesystem.Loader', 'django.template.loaders.app_directories.Loader']
+    templates[0]['APP_DIRS'] = False
+    templates[0]['OPTIONS']['loaders'] = [('django.template.loaders.cached.Loader', loaders)] if cached else loaders
+    return templates
+
+
+def timed_get(client, url):
+    '''
+    GETs `url` and returns (response, wall seconds, template render seconds).
+    '''
+    middleware.instrument_templates()
+    record = middleware._local.record = middleware.RequestRecord(sample_queries=False)
+    started = time.perf_counter()
+    try:
+        response = client.get(url)
+    finally:
+        middleware._local.record = None
+    return response, time.perf_counter() - started, record.template
+
+
+def load_ballots():
+    '''
+    {election id: [(position id, [candidate ids]), ...]} in ballot order,
+    and {faculty id: [election ids]}.
+    '''
+    ballots = defaultdict(list)
+    for position in Position.objects.order_by('election', 'text', 'pk').prefetch_related('candidates'):
+        ballots[position.election_id].append((position.pk, [c.pk for c in position.candidates.all()]))
+    by_faculty = defaultdict(list)
+    for pk, faculty_id in Election.objects.values_list('pk', 'faculty_id'):
+        by_faculty[faculty_id].append(pk)
+    return ballots, by_faculty
+
+
+def faculties_by_username():
+    return dict(Student.faculty.through.objects.values_list('student__user__username', 'faculty_id'))
+
+
+def run_voters(usernames, concurrency, voter_class=Voter, readers=0, reader_class=ResultsReader):
+    '''
+    Sends every student through the full voting flow, `concurrency` at a
+    time, while `readers` EC officers keep reloading the results of every
+    election. Returns (samples, wall seconds).
+    '''
+    ballots, by_faculty = load_ballots()
+    faculty_of = faculties_by_username()
+    # list.append is atomic, so the voter threads can share one list.
+    samples = []
+    stop = threading.Event()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency + readers) as pool:
+        reading = [pool.submit(reader_class(samples).run, sorted(ballots), stop) for _ in range(readers)]
+        futures = [
+            pool.submit(voter_class(username, ballots, samples).run, by_faculty[faculty_of[username]])
+            for username in usernames
+        ]
+        for future in futures:
+            future.result()
+        seconds = time.perf_counter() - started
+        stop.set()
+        for future in reading:
+            future.result()
+    return samples, seconds
+
+
+def run_logins(usernames, concurrency):
+    '''
+    Logs every student in, `concurrency` at a time, and nothing else.
+    Returns (samples, wall seconds).
+    '''
+    samples = []
+
+    def login(username):
+        voter = Voter(username, {}, samples)
+        with connection.execute_wrapper(voter.counter):
+            voter.request('login POST', 'post', reverse('login'), {
+                'username': username, 'password': BENCH_PASSWORD
+            }, expect=302)
+        connection.close()
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        list(pool.map(login, usernames))
+    return samples, time.perf_counter() - started
+
+
+def run_async_voters(usernames, concurrency, voter_class=AsyncVoter):
+    '''
+    run_voters for the ASGI path: `concurrency` voters in flight as
+    coroutines on one event loop.
+    '''
+    ballots, by_faculty = load_ballots()
+    faculty_of = faculties_by_username()
+    samples = []
+
+    async def main():
+        slots = asyncio.Semaphore(concurrency)
+
+        async def run(username):
+            async with slots:
+                await voter_class(username, ballots, samples).run(by_faculty[faculty_of[username]])
+
+        await asyncio.gather(*(run(username) for username in usernames))
+
+    started = time.perf_counter()
+    asyncio.run(main())
+    return samples, time.perf_counter() - started
+
+
+def environment():
+    return {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'database': connection.vendor,
+        'ballot_mode': settings.BALLOT_MODE,
+        'vote_ingestion': settings.VOTE_INGESTION,
+        'sqlite_profile': settings.SQLITE_PROFILE,
+        'cached_auth': settings.CACHED_AUTH,
+        'password_iterations': settings.PASSWORD_ITERATIONS,
+        'login_hashing_workers': settings.LOGIN_HASHING_WORKERS,
+    }
+
+
+def write_report(path, report):
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, sort_keys=True)
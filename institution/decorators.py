@@ -1,5 +1,10 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.contrib.auth.decorators import user_passes_test
+from django.contrib.auth.views import redirect_to_login
 
 
 def student_required(function=None, redirect_field_name=REDIRECT_FIELD_NAME, login_url='login'):
@@ -30,3 +35,25 @@ def ec_official_required(function=None, redirect_field_name=REDIRECT_FIELD_NAME,
     if function:
         return actual_decorator(function)
     return actual_decorator
+
+
+def async_student_required(function=None, redirect_field_name=REDIRECT_FIELD_NAME, login_url='login'):
+    '''
+    login_required + student_required for async views. Loading the user
+    hits the session and user tables, so it runs in a worker thread; the
+    view then finds request.user already resolved.
+    '''
+    def decorator(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            is_student = await sync_to_async(
+                lambda: request.user.is_authenticated and request.user.is_active and request.user.is_student,
+                thread_sensitive=False
+            )()
+            if is_student:
+                return await view_func(request, *args, **kwargs)
+            return redirect_to_login(request.get_full_path(), login_url or settings.LOGIN_URL, redirect_field_name)
+        return _wrapped_view
+    if function:
+        return decorator(function)
+    return decorator
@@ -0,0 +1,80 @@
+'''
+Cached list of the elections a student can still vote in.
+
+The landing page is the most requested URL on polling day. Each student's
+list is cached together with the versions of the faculties it was built
+from; voting or changing faculties drops the student's entry, and EC edits
+to an election bump its faculty's version so every affected list rebuilds.
+'''
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Election, Faculty
+from .routers import cache_timeout
+
+
+def _student_key(student_id):
+    return 'open-elections:%d' % student_id
+
+
+def _faculty_key(faculty_id):
+    return 'open-elections:faculty:%d:version' % faculty_id
+
+
+def get_faculty_versions(faculty_ids):
+    keys = {_faculty_key(faculty_id): faculty_id for faculty_id in faculty_ids}
+    versions = cache.get_many(keys)
+    missing = {key: int(time.time() * 1000) for key in keys if key not in versions}
+    if missing:
+        cache.set_many(missing, None)
+        versions.update(missing)
+    return {keys[key]: version for key, version in versions.items()}
+
+
+def invalidate_faculty(faculty_id):
+    try:
+        cache.incr(_faculty_key(faculty_id))
+    except ValueError:
+        get_faculty_versions([faculty_id])
+
+
+def invalidate_student(student_id):
+    cache.delete(_student_key(student_id))
+
+
+def open_elections_queryset(student_id, faculty_ids):
+    return Election.objects.filter(faculty__in=faculty_ids, archived=False) \
+        .exclude(voted_elections__student=student_id) \
+        .select_related('faculty') \
+        .annotate(positions_count=Count('positions')) \
+        .filter(positions_count__gt=0) \
+        .order_by('name')
+
+
+def build_entry(student_id):
+    # Read the versions before the data: a concurrent bump then leaves an
+    # entry that is already out of date rather than one that is silently stale.
+    faculties = list(Faculty.objects.filter(student_faculty=student_id).order_by('name'))
+    versions = get_faculty_versions([faculty.pk for faculty in faculties])
+    elections = open_elections_queryset(student_id, [faculty.pk for faculty in faculties])
+    return {
+        'faculties': faculties,
+        'versions': versions,
+        'elections': list(elections),
+    }
+
+
+def get_open_elections(student_id):
+    '''
+    Returns (faculties, elections) for the student. A cache hit costs no
+    queries at all.
+    '''
+    key = _student_key(student_id)
+    entry = cache.get(key)
+    if entry is None or get_faculty_versions(entry['versions']) != entry['versions']:
+        entry = build_entry(student_id)
+        cache.set(key, entry, cache_timeout(settings.OPEN_ELECTIONS_CACHE_TIMEOUT))
+    return entry['faculties'], entry['elections']
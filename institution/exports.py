@@ -0,0 +1,70 @@
+'''
+Streaming exports of election data.
+
+Rows are pulled from the database with QuerySet.iterator() and written out
+as they arrive, so memory use does not depend on the size of the electorate.
+'''
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import Http404, StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+
+CONTENT_TYPES = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class Echo:
+    '''
+    File-like object for csv.writer that hands each row straight back
+    instead of buffering it.
+    '''
+
+    def write(self, value):
+        return value
+
+
+def stream_csv(columns, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_ndjson(columns, rows):
+    for row in rows:
+        yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
+
+
+def voter_rows(election):
+    return election.voted_elections \
+        .order_by('date', 'pk') \
+        .values_list('student__user__username', 'student__student_number', 'date') \
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def tally_rows(election):
+    return election.tallies \
+        .order_by('position__text', 'position', '-count', 'candidate__full_name') \
+        .values_list('position__text', 'candidate__full_name', 'count') \
+        .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+DATASETS = {
+    'voters': (('username', 'student_number', 'date'), voter_rows),
+    'tallies': (('position', 'candidate', 'votes'), tally_rows),
+}
+
+
+def export_response(election, dataset, export_format):
+    if dataset not in DATASETS or export_format not in CONTENT_TYPES:
+        raise Http404('Unknown export %s.%s' % (dataset, export_format))
+    columns, get_rows = DATASETS[dataset]
+    stream = stream_csv if export_format == 'csv' else stream_ndjson
+    response = StreamingHttpResponse(stream(columns, get_rows(election)), content_type=CONTENT_TYPES[export_format])
+    response['Content-Disposition'] = 'attachment; filename="election-%d-%s.%s"' % (election.pk, dataset, export_format)
+    return response
@@ -2,8 +2,9 @@ from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.db import transaction
 from django.forms.utils import ValidationError
+from django.utils.html import format_html
 
-from institution.models import (Candidate, Position, Student, VotedElection, StudentVote, Faculty, User)
+from institution.models import (Position, Student, VotedElection, Faculty, User)
 
 
 class ECOfficerSignUpForm(UserCreationForm):
@@ -60,20 +61,63 @@ class BaseCandidateInlineFormSet(forms.BaseInlineFormSet):
         super().clean()
 
 
-class VoteForm(forms.ModelForm):
-    candidate = forms.ModelChoiceField(
-        queryset=Candidate.objects.none(),
+def candidate_label(candidate):
+    '''
+    A ballot candidate's radio label: their mugshot thumbnail, if they have
+    one, and their name.
+    '''
+    thumbnails = candidate.thumbnails
+    if thumbnails is None:
+        return candidate.full_name
+    return format_html(
+        '<picture><source type="image/webp" srcset="{}">'
+        '<img src="{}" srcset="{}" width="{}" height="{}" alt="" loading="lazy" class="rounded mr-2"></picture>{}',
+        thumbnails.webp_srcset, thumbnails.src, thumbnails.srcset, thumbnails.size, thumbnails.size,
+        candidate.full_name)
+
+
+class VoteForm(forms.Form):
+    candidate = forms.TypedChoiceField(
+        coerce=int,
         widget=forms.RadioSelect(),
         required=True,
-        empty_label=None,
-        label="Candidates", 
+        label="Candidates",
         help_text="Select your desired candidate and hit next")
 
-    class Meta:
-        model = StudentVote
-        fields = ('candidate', )
+    def __init__(self, *args, **kwargs):
+        self.position = kwargs.pop('position')
+        super().__init__(*args, **kwargs)
+        self.candidates = {candidate.pk: candidate for candidate in self.position.candidates}
+        self.fields['candidate'].choices = [
+            (candidate.pk, candidate_label(candidate)) for candidate in self.position.candidates
+        ]
+
+    def get_candidate(self):
+        return self.candidates[self.cleaned_data['candidate']]
+
+
+class BallotForm(forms.Form):
+    '''
+    A whole election on one page: one radio list per position. Positions
+    and candidates come from the cached ballot snapshot, so building and
+    validating the form does not touch the database.
+    '''
 
     def __init__(self, *args, **kwargs):
-        position = kwargs.pop('position')
+        self.positions = kwargs.pop('positions')
         super().__init__(*args, **kwargs)
-        self.fields['candidate'].queryset = position.candidates.order_by('full_name')
+        self.candidates = {}
+        for position in self.positions:
+            self.candidates.update((candidate.pk, candidate) for candidate in position.candidates)
+            self.fields['position_%d' % position.pk] = forms.TypedChoiceField(
+                choices=[(candidate.pk, candidate_label(candidate)) for candidate in position.candidates],
+                coerce=int,
+                widget=forms.RadioSelect(),
+                required=True,
+                label=position.text)
+
+    def get_candidates(self):
+        return [
+            self.candidates[self.cleaned_data['position_%d' % position.pk]]
+            for position in self.positions
+        ]
@@ -0,0 +1,75 @@
+'''
+ASGI handler for digital-voting/asgi.py.
+
+Django 3.1's ASGIHandler iterates a StreamingHttpResponse inside the event
+loop. The EC's exports read the database while they stream, and the live
+results stream blocks while it waits for votes. Under the stock handler the
+first fails with SynchronousOnlyOperation and the second would stall every
+voter served by the worker. This handler pulls each part of a streaming
+response in a thread of the response's own. The part's cursor and database
+connection stay in that thread. The stream stops when the client goes away.
+'''
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.handlers import asgi
+from django.db import connections
+
+_receive = contextvars.ContextVar('receive')
+
+
+def response_headers(response):
+    # As ASGIHandler.send_response builds them.
+    headers = []
+    for header, value in response.items():
+        if isinstance(header, str):
+            header = header.encode('ascii')
+        if isinstance(value, str):
+            value = value.encode('latin1')
+        headers.append((bytes(header), bytes(value)))
+    for c in response.cookies.values():
+        headers.append((b'Set-Cookie', c.output(header='').encode('ascii').strip()))
+    return headers
+
+
+def close_stream(response):
+    response.close()
+    # The thread goes away with the stream, so its connection has to as well.
+    connections.close_all()
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    async def __call__(self, scope, receive, send):
+        _receive.set(receive)
+        await super().__call__(scope, receive, send)
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': response_headers(response),
+        })
+        loop = asyncio.get_running_loop()
+        executor = ThreadPoolExecutor(1, thread_name_prefix='stream')
+        # The request body has been read, so the next message is the client
+        # disconnecting.
+        disconnect = asyncio.ensure_future(_receive.get()())
+        parts = iter(response)
+        try:
+            while True:
+                part = loop.run_in_executor(executor, next, parts, None)
+                await asyncio.wait({part, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+                if disconnect.done() or part.result() is None:
+                    break
+                for chunk, _ in self.chunk_bytes(part.result()):
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            if not disconnect.done():
+                await send({'type': 'http.response.body'})
+        finally:
+            disconnect.cancel()
+            # Runs after any part still being pulled.
+            await loop.run_in_executor(executor, close_stream, response)
+            executor.shutdown(wait=False)
@@ -0,0 +1,86 @@
+'''
+Password hashing for the login storm when the polls open.
+
+PBKDF2 is most of what a login costs, and Django's PBKDF2PasswordHasher
+runs it on the request thread. PBKDF2PasswordHasher here differs in two ways:
+
+* It hashes with settings.PASSWORD_ITERATIONS iterations. When a user logs
+  in, Django rehashes their password if it was hashed with another hasher or
+  iteration count. So changing the setting, or putting another hasher first
+  in PASSWORD_HASHERS, moves every account over as its owner logs in, and no
+  account is invalidated.
+* With settings.LOGIN_HASHING_WORKERS set, the hashing runs in a pool of
+  that many processes shared by the web process's threads. The request
+  thread waits for the result without holding the GIL, so the web process
+  keeps serving pages while logins hash on the other cores.
+'''
+import multiprocessing
+import os
+import threading
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from .workers import process_pool
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _encode(password, salt, iterations):
+    return hashers.PBKDF2PasswordHasher().encode(password, salt, iterations)
+
+
+def get_pool():
+    '''
+    The process's hashing pool, started on first use, or None when
+    LOGIN_HASHING_WORKERS is 0.
+    '''
+    global _pool
+    if not settings.LOGIN_HASHING_WORKERS:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # Spawned rather than forked: forking a process that is running
+            # request threads can leave the child holding their locks.
+            _pool = process_pool(settings.LOGIN_HASHING_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+        return _pool
+
+
+def start():
+    '''
+    Starts every worker of the pool now, so the first logins don't wait for
+    them.
+    '''
+    pool = get_pool()
+    if pool is not None:
+        for future in [pool.submit(os.getpid) for _ in range(settings.LOGIN_HASHING_WORKERS)]:
+            future.result()
+
+
+def shutdown():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+class PBKDF2PasswordHasher(hashers.PBKDF2PasswordHasher):
+    '''
+    PBKDF2-SHA256 at settings.PASSWORD_ITERATIONS, hashed in the
+    LOGIN_HASHING_WORKERS pool. Its hashes are the same as Django's.
+    '''
+
+    @property
+    def iterations(self):
+        return settings.PASSWORD_ITERATIONS
+
+    def encode(self, password, salt, iterations=None):
+        # verify() and harden_runtime() call encode() as well.
+        pool = get_pool()
+        if pool is None:
+            return super().encode(password, salt, iterations)
+        assert password is not None
+        assert salt and '$' not in salt
+        return pool.submit(_encode, password, salt, iterations or self.iterations).result()
@@ -0,0 +1,366 @@
+'''
+Write-behind ballot journal, used when settings.VOTE_INGESTION is 'journal'.
+
+SQLite lets one transaction write at a time, so saving every ballot in its
+own transaction makes voters queue on the write lock (and, past the busy
+timeout, fail with "database is locked"). In journal mode a validated full
+ballot is appended to an append-only file in VOTE_JOURNAL_DIR and fsynced.
+One writer at a time saves the journal in batches of
+VOTE_JOURNAL_BATCH_SIZE ballots, each batch one transaction.
+
+There is no writer process: a request waiting for its ballot to be saved
+tries the lock on writer.lock and, if it gets it, saves everything queued so
+far, its own ballot and those of every voter who arrived meanwhile (a group
+commit). The requests that didn't get the lock wait for the next batch.
+After each batch commits, the writer records how far into the journal it got
+in the checkpoint file, which is what the waiting requests watch. Ballots
+whose student already voted are dropped by the writer, so a crash between
+the commit and the checkpoint only replays ballots that are then skipped.
+
+The journal is never truncated: it doubles as a record of every ballot
+submitted. Archive it with the election.
+'''
+import json
+import logging
+import os
+import time
+from collections import Counter, defaultdict, namedtuple
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.db import IntegrityError, transaction
+
+from . import eligibility, ledger, progress
+from .live import publisher
+from .models import Candidate, CandidateTally, Election, Student, StudentVote, TurnoutCount, VotedElection
+from .voting import ElectionClosed, cast_ballot, check_open
+
+logger = logging.getLogger(__name__)
+
+JOURNAL_FILE = 'ballots.jsonl'
+CHECKPOINT_FILE = 'checkpoint'
+WRITER_LOCK_FILE = 'writer.lock'
+READ_SIZE = 1024 * 1024
+POLL_INTERVAL = 0.01
+# Bounds how long a pending marker outlives a journal that is never drained.
+PENDING_TIMEOUT = 24 * 60 * 60
+
+# Outcomes of submit().
+RECORDED = 'recorded'
+DUPLICATE = 'duplicate'
+REJECTED = 'rejected'
+QUEUED = 'queued'
+
+Entry = namedtuple('Entry', 'offset student_id election_id candidate_ids')
+
+
+def journal_path(name):
+    return os.path.join(settings.VOTE_JOURNAL_DIR, name)
+
+
+def append(student_id, election_id, candidate_ids):
+    '''
+    Durably appends one ballot and returns the journal offset just past it.
+    '''
+    if fcntl is None:
+        raise ImproperlyConfigured('The vote journal needs POSIX file locking.')
+    os.makedirs(settings.VOTE_JOURNAL_DIR, exist_ok=True)
+    line = json.dumps({
+        'student': student_id,
+        'election': election_id,
+        'candidates': list(candidate_ids),
+        'submitted': time.time(),
+    }).encode() + b'\n'
+    fd = os.open(journal_path(JOURNAL_FILE), os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o600)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        size = os.fstat(fd).st_size
+        # A crash mid-append leaves a line without its newline; end it so it
+        # doesn't swallow this ballot.
+        if size and os.pread(fd, 1, size - 1) != b'\n':
+            line = b'\n' + line
+        os.write(fd, line)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    offset = size + len(line)
+    cache.set(pending_key(student_id, election_id), offset, PENDING_TIMEOUT)
+    return offset
+
+
+def read_checkpoint():
+    try:
+        with open(journal_path(CHECKPOINT_FILE)) as f:
+            return int(f.read() or 0)
+    except FileNotFoundError:
+        return 0
+
+
+def write_checkpoint(offset):
+    path = journal_path(CHECKPOINT_FILE)
+    with open(path + '.tmp', 'w') as f:
+        f.write(str(offset))
+    os.replace(path + '.tmp', path)
+
+
+def read_entries(offset, limit=READ_SIZE):
+    '''
+    The complete journal entries after `offset`, reading at most about
+    `limit` bytes. Lines that don't parse are logged and skipped.
+    '''
+    try:
+        with open(journal_path(JOURNAL_FILE), 'rb') as f:
+            f.seek(offset)
+            data = f.read(limit)
+    except FileNotFoundError:
+        return []
+    entries = []
+    # Only whole lines: the last one may still be being written.
+    for line in data.splitlines(keepends=True):
+        if not line.endswith(b'\n'):
+            break
+        offset += len(line)
+        try:
+            ballot = json.loads(line)
+            entries.append(Entry(offset, ballot['student'], ballot['election'], ballot['candidates']))
+        except (ValueError, KeyError, TypeError):
+            if line.strip():
+                logger.error('Skipping unreadable vote journal entry ending at offset %d: %r', offset, line)
+            entries.append(Entry(offset, None, None, []))
+    return entries
+
+
+def backlog():
+    '''
+    Ballots appended but not yet saved.
+    '''
+    offset, entries = read_checkpoint(), []
+    while True:
+        chunk = read_entries(offset)
+        if not chunk:
+            return [entry for entry in entries if entry.student_id is not None]
+        entries.extend(chunk)
+        offset = chunk[-1].offset
+
+
+def pending_key(student_id, election_id):
+    return 'journal-pending:%d:%d' % (student_id, election_id)
+
+
+def is_pending(student_id, election_id):
+    '''
+    Whether the student has a ballot for the election waiting in the
+    journal. Costs a cache lookup, however long the backlog. With a cache
+    that isn't shared between processes, a ballot journalled by another
+    process isn't seen; the writer drops the second ballot anyway.
+    '''
+    offset = cache.get(pending_key(student_id, election_id))
+    return offset is not None and read_checkpoint() < offset
+
+
+def wait(offset, timeout):
+    '''
+    Waits until everything up to `offset` is saved, saving it if no one else
+    is. Returns False if it took longer than `timeout` seconds.
+    '''
+    deadline = time.monotonic() + timeout
+    while read_checkpoint() < offset:
+        if try_drain(offset):
+            continue
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(POLL_INTERVAL)
+    return True
+
+
+def submit(student, election, candidates):
+    '''
+    Journals a full ballot and waits for it to be saved. Returns RECORDED,
+    DUPLICATE if an earlier ballot of the student was counted instead,
+    REJECTED if the ballot no longer matches the election, or QUEUED if the
+    writer didn't get to it within VOTE_JOURNAL_CONFIRM_TIMEOUT.
+    '''
+    candidate_ids = [candidate.pk for candidate in candidates]
+    offset = append(student.pk, election.pk, candidate_ids)
+    if not wait(offset, settings.VOTE_JOURNAL_CONFIRM_TIMEOUT):
+        return QUEUED
+    saved = set(StudentVote.objects.filter(student=student, election=election).values_list('candidate_id', flat=True))
+    if saved == set(candidate_ids):
+        return RECORDED
+    if student.elections.filter(pk=election.pk).exists():
+        return DUPLICATE
+    return REJECTED
+
+
+def check_ballots(entries):
+    '''
+    Drops entries without a student, ballots for archived elections and
+    ballots for candidates that no longer stand in the election, or for two
+    candidates of one position. Returns the remaining entries and
+    {candidate id: (position id, election id)}.
+    '''
+    entries = [entry for entry in entries if entry.student_id is not None]
+    candidates = {
+        pk: (position_id, election_id) for pk, position_id, election_id in Candidate.objects
+        .filter(pk__in={pk for entry in entries for pk in entry.candidate_ids})
+        .values_list('pk', 'position_id', 'position__election_id')
+    }
+    archived = set(Election.objects.filter(pk__in={entry.election_id for entry in entries}, archived=True)
+                   .values_list('pk', flat=True))
+
+    ballots = []
+    for entry in entries:
+        if entry.election_id in archived:
+            logger.warning('Dropping journalled ballot of student %d in election %d: the election is archived',
+                           entry.student_id, entry.election_id)
+            continue
+        positions = [candidates.get(pk, (None, None)) for pk in entry.candidate_ids]
+        if any(election_id != entry.election_id for _, election_id in positions) or \
+                len({position_id for position_id, _ in positions}) != len(positions):
+            logger.warning('Dropping journalled ballot of student %d in election %d: it no longer matches the '
+                           'election', entry.student_id, entry.election_id)
+            continue
+        ballots.append(entry)
+    return ballots, candidates
+
+
+def save_batch(entries):
+    '''
+    Saves a batch of journal entries in one transaction, skipping students
+    who already voted in the election and the ballots check_ballots() drops.
+    '''
+    with transaction.atomic():
+        entries, candidates = check_ballots(entries)
+        if not entries:
+            return
+        student_ids = {entry.student_id for entry in entries}
+        election_ids = {entry.election_id for entry in entries}
+        voted = set(VotedElection.objects.filter(student__in=student_ids, election__in=election_ids)
+                    .values_list('student_id', 'election_id'))
+        ballots = []
+        for entry in entries:
+            key = (entry.student_id, entry.election_id)
+            if key in voted:
+                continue
+            voted.add(key)
+            ballots.append(entry)
+
+        StudentVote.objects.bulk_create([
+            StudentVote(
+                student_id=entry.student_id,
+                candidate_id=pk,
+                position_id=candidates[pk][0],
+                election_id=entry.election_id)
+            for entry in ballots
+            for pk in entry.candidate_ids
+        ])
+        CandidateTally.objects.increment(pk for entry in ballots for pk in entry.candidate_ids)
+        # bulk_create sends no post_save, so the eligibility and progress
+        # caches and the live results are told here.
+        TurnoutCount.objects.increment(VotedElection.objects.bulk_create([
+            VotedElection(student_id=entry.student_id, election_id=entry.election_id) for entry in ballots
+        ]))
+        by_election = defaultdict(list)
+        for entry in ballots:
+            by_election[entry.election_id].append(
+                (entry.student_id, [(candidates[pk][0], pk) for pk in entry.candidate_ids], True))
+        for election_id, ledger_entries in sorted(by_election.items()):
+            ledger.append(election_id, ledger_entries)
+        check_open(by_election)
+
+    tallies, voters = defaultdict(Counter), Counter()
+    for entry in ballots:
+        tallies[entry.election_id].update(entry.candidate_ids)
+        voters[entry.election_id] += 1
+        eligibility.invalidate_student(entry.student_id)
+        progress.record(entry.student_id, entry.election_id,
+                        position_ids=[candidates[pk][0] for pk in entry.candidate_ids], closed=True)
+    for election_id, candidate_ids in tallies.items():
+        publisher.record(election_id, candidate_ids=candidate_ids.elements(), voters=voters[election_id])
+
+
+def save_each(entries):
+    '''
+    Fallback when a batch hits a vote saved outside the journal, or an
+    election archived since check_ballots() read it: saves the ballots one
+    transaction at a time, skipping the conflicting ones and the ballots
+    check_ballots() drops.
+    '''
+    ballots, candidates = check_ballots(entries)
+    for entry in ballots:
+        try:
+            cast_ballot(Student(user_id=entry.student_id), Election(pk=entry.election_id), [
+                Candidate(pk=pk, position_id=candidates[pk][0]) for pk in entry.candidate_ids
+            ])
+        except (IntegrityError, ElectionClosed):
+            pass
+
+
+def drain(until=None):
+    '''
+    Saves the journal from the checkpoint on, up to at least `until` or to
+    the end. The caller must hold the writer lock. Returns the number of
+    entries read.
+    '''
+    offset, count = read_checkpoint(), 0
+    while until is None or offset < until:
+        entries = read_entries(offset)
+        if not entries:
+            break
+        for start in range(0, len(entries), settings.VOTE_JOURNAL_BATCH_SIZE):
+            batch = entries[start:start + settings.VOTE_JOURNAL_BATCH_SIZE]
+            try:
+                save_batch(batch)
+            except (IntegrityError, ElectionClosed):
+                save_each(batch)
+            offset = batch[-1].offset
+            write_checkpoint(offset)
+            # A marker past the checkpoint belongs to a later ballot.
+            markers = cache.get_many({pending_key(entry.student_id, entry.election_id)
+                                      for entry in batch if entry.student_id is not None})
+            cache.delete_many([key for key, pending in markers.items() if pending <= offset])
+            count += len(batch)
+    return count
+
+
+@contextmanager
+def writer_lock(block=False):
+    '''
+    Yields whether this thread got the writer lock. Threads of one process
+    exclude each other too: every call opens its own file description.
+    '''
+    os.makedirs(settings.VOTE_JOURNAL_DIR, exist_ok=True)
+    fd = os.open(journal_path(WRITER_LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if block else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+        else:
+            yield True
+    finally:
+        os.close(fd)
+
+
+def try_drain(until=None):
+    '''
+    Drains the journal unless another thread or process already is. Returns
+    whether it did.
+    '''
+    with writer_lock() as acquired:
+        if not acquired:
+            return False
+        try:
+            drain(until)
+        except Exception:
+            # The ballots stay queued for the next writer.
+            logger.exception('Saving the vote journal failed')
+            return False
+        return True
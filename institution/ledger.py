@@ -0,0 +1,186 @@
+'''
+Tamper-evident ledger of the votes.
+
+Every write of a ballot, whether votes saved or a ballot closed, appends a
+LedgerEntry in the same transaction. Entries are numbered per election, and
+each entry's hash covers the previous entry's hash and the entry's own
+contents. Changing, removing or inserting an entry therefore breaks every
+hash after it.
+
+The hashes are HMAC-SHA256 under settings.LEDGER_KEY, which is kept out of
+the database. Someone who can edit the database, votes and ledger alike,
+can't recompute the chain after their edit without the key. The checkpoints
+are in the same database, so they don't guard against that; the key does.
+
+`manage.py verify_ledger` walks each election's chain from its last
+LedgerCheckpoint. It checks that the StudentVote and VotedElection rows of
+the students in the new entries still match the ledger, then records a new
+checkpoint. Its cost grows with the votes cast since the last run, not with
+the whole history. A checkpoint also stores the Merkle root of its entries'
+hashes, so any single entry can be shown to belong to it. It does not
+re-read older entries or the rows of students who have not voted since, so
+tampering with those is only found by --full, which re-checks every entry,
+every checkpoint and every student's rows.
+
+Appends to one election's chain are serialised: the election's row is
+locked where the database supports it, and SQLite serialises writers anyway.
+'''
+import hashlib
+import hmac
+import json
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from .models import Candidate, Election, LedgerCheckpoint, LedgerEntry, StudentVote, VotedElection
+
+GENESIS = '0' * 64
+CHUNK_SIZE = 500
+
+
+def entry_hash(previous, election_id, sequence, student_id, votes, closed):
+    payload = json.dumps([election_id, sequence, student_id, votes, closed], separators=(',', ':'))
+    return hmac.new(settings.LEDGER_KEY.encode(), (previous + payload).encode(), hashlib.sha256).hexdigest()
+
+
+def merkle_root(hashes):
+    '''
+    Merkle root of hex digests. Leaves and inner nodes are hashed with
+    different prefixes so one can't pass for the other.
+    '''
+    level = [hashlib.sha256(b'\x00' + bytes.fromhex(h)).digest() for h in hashes]
+    if not level:
+        return GENESIS
+    while len(level) > 1:
+        if len(level) % 2:
+            level.append(level[-1])
+        level = [hashlib.sha256(b'\x01' + level[i] + level[i + 1]).digest() for i in range(0, len(level), 2)]
+    return level[0].hex()
+
+
+def append(election_id, ballots):
+    '''
+    Appends an entry per (student id, [(position id, candidate id)], closed)
+    to the election's chain. Must run inside the transaction that saves the
+    votes.
+    '''
+    if connection.features.has_select_for_update:
+        list(Election.objects.select_for_update().filter(pk=election_id).values_list('pk'))
+    # The last entry is read backwards through unique_ledger_sequence.
+    sequence, previous = LedgerEntry.objects.filter(election=election_id) \
+        .order_by('-sequence') \
+        .values_list('sequence', 'hash') \
+        .first() or (0, GENESIS)
+    entries = []
+    for student_id, votes, closed in ballots:
+        sequence += 1
+        votes = sorted([position_id, candidate_id] for position_id, candidate_id in votes)
+        previous = entry_hash(previous, election_id, sequence, student_id, votes, closed)
+        entries.append(LedgerEntry(election_id=election_id, sequence=sequence, student_id=student_id,
+                                   votes=votes, closed=closed, hash=previous))
+    LedgerEntry.objects.bulk_create(entries)
+
+
+def check_chain(election_id, entries, sequence, previous, problems):
+    '''
+    Follows (sequence, hash, student id, votes, closed) entries on from the
+    given sequence and hash. Returns (sequence, hash, student id) of each.
+    '''
+    checked = []
+    for entry_sequence, stored, student_id, votes, closed in entries:
+        sequence += 1
+        if entry_sequence != sequence:
+            problems.append('entry %d is missing (found %d next)' % (sequence, entry_sequence))
+            sequence = entry_sequence
+        if stored != entry_hash(previous, election_id, entry_sequence, student_id, votes, closed):
+            problems.append('entry %d does not match its hash' % entry_sequence)
+        checked.append((entry_sequence, stored, student_id))
+        previous = stored
+    return checked
+
+
+def check_votes(election_id, student_ids, problems):
+    '''
+    Compares the ledger with the StudentVote and VotedElection rows of the
+    given students. Votes for candidates the EC has since removed went with
+    them, so they are only expected in the ledger.
+    '''
+    student_ids = sorted(student_ids)
+    candidate_ids = set(Candidate.objects.filter(position__election=election_id).values_list('pk', flat=True))
+    for i in range(0, len(student_ids), CHUNK_SIZE):
+        chunk = student_ids[i:i + CHUNK_SIZE]
+        ledger_votes, ledger_closed = defaultdict(set), set()
+        for student_id, votes, closed in LedgerEntry.objects \
+                .filter(election=election_id, student_id__in=chunk) \
+                .values_list('student_id', 'votes', 'closed'):
+            ledger_votes[student_id].update((position_id, candidate_id) for position_id, candidate_id in votes
+                                          if candidate_id in candidate_ids)
+            if closed:
+                ledger_closed.add(student_id)
+        saved_votes = defaultdict(set)
+        for student_id, position_id, candidate_id in StudentVote.objects \
+                .filter(election=election_id, student__in=chunk) \
+                .values_list('student', 'position', 'candidate'):
+            saved_votes[student_id].add((position_id, candidate_id))
+        saved_closed = set(VotedElection.objects.filter(election=election_id, student__in=chunk)
+                           .values_list('student', flat=True))
+        for student_id in chunk:
+            if saved_votes[student_id] != ledger_votes[student_id]:
+                problems.append('the votes of student %d differ from the ledger' % student_id)
+            if (student_id in saved_closed) != (student_id in ledger_closed):
+                problems.append('the closed ballot of student %d differs from the ledger' % student_id)
+
+
+def verify(election, full=False, checkpoint=True):
+    '''
+    Checks the election's ledger after its last checkpoint, or all of it with
+    `full`. Returns (entries checked, problems). With `checkpoint`, a clean
+    run records a checkpoint at the last entry.
+    '''
+    problems = []
+    checkpoints = LedgerCheckpoint.objects.filter(election=election).order_by('sequence')
+    last = checkpoints.last()
+    start = None if full else last
+    sequence, previous = (start.sequence, start.hash) if start else (0, GENESIS)
+    if start is not None:
+        stored = LedgerEntry.objects.filter(election=election, sequence=start.sequence) \
+            .values_list('hash', flat=True).first()
+        if stored != start.hash:
+            problems.append('entry %d no longer matches its checkpoint' % start.sequence)
+
+    entries = LedgerEntry.objects.filter(election=election, sequence__gt=sequence) \
+        .order_by('sequence') \
+        .values_list('sequence', 'hash', 'student_id', 'votes', 'closed') \
+        .iterator(chunk_size=CHUNK_SIZE)
+    checked = check_chain(election.pk, entries, sequence, previous, problems)
+
+    if full:
+        hashes = [stored for _, stored, _ in checked]
+        index = {entry_sequence: i for i, (entry_sequence, _, _) in enumerate(checked)}
+        covered = 0
+        for point in checkpoints:
+            i = index.get(point.sequence)
+            if i is None or hashes[i] != point.hash:
+                problems.append('checkpoint %d does not match the ledger' % point.sequence)
+                continue
+            if merkle_root(hashes[covered:i + 1]) != point.root:
+                problems.append('the Merkle root of checkpoint %d does not match the ledger' % point.sequence)
+            covered = i + 1
+        student_ids = {student_id for _, _, student_id in checked}
+        voters = set(StudentVote.objects.filter(election=election).values_list('student', flat=True).distinct())
+        for student_id in sorted(voters - student_ids):
+            problems.append('student %d has votes that are not in the ledger' % student_id)
+        new = [entry for entry in checked if entry[0] > (last.sequence if last else 0)]
+    else:
+        student_ids = {student_id for _, _, student_id in checked}
+        new = checked
+
+    # An archived election's votes are in its archive file, not the tables.
+    if not election.archived:
+        check_votes(election.pk, student_ids, problems)
+
+    if checkpoint and new and not problems:
+        LedgerCheckpoint.objects.create(election=election, sequence=new[-1][0], hash=new[-1][1],
+                                        root=merkle_root([stored for _, stored, _ in new]))
+    return len(checked), problems
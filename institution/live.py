@@ -0,0 +1,164 @@
+'''
+In-process publisher behind the live results stream (ec:election_results_live).
+
+Votes report themselves here once their transaction commits. For every
+election that somebody is watching, one background thread folds those
+reports into the current totals and, every LIVE_RESULTS_INTERVAL seconds,
+pushes the candidates whose counts changed to every subscriber. The totals
+are re-read from the database every LIVE_RESULTS_RESYNC seconds (one query
+per watched election, however many officers are watching), which also picks
+up votes cast through other processes.
+'''
+import logging
+import queue
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.db import connection
+
+from .models import CandidateTally, VotedElection
+
+logger = logging.getLogger(__name__)
+
+
+class Subscription:
+    def __init__(self, election_id):
+        self.election_id = election_id
+        self.events = queue.Queue(maxsize=100)
+        # Set when the subscriber fell behind and missed updates; it should
+        # be sent the full state instead of the next change.
+        self.stale = False
+
+    def get(self, timeout):
+        return self.events.get(timeout=timeout)
+
+    def reset(self, event):
+        # Drop the backlog and start over from the full state.
+        with self.events.mutex:
+            self.events.queue.clear()
+        self.events.put_nowait(event)
+        self.stale = False
+
+
+class ElectionState:
+    def __init__(self):
+        self.tallies = {}
+        self.voters = 0
+        self.pending_tallies = Counter()
+        self.pending_voters = 0
+        self.loaded_at = None
+
+    def as_event(self, candidate_ids=None):
+        tallies = self.tallies if candidate_ids is None else {pk: self.tallies.get(pk, 0) for pk in candidate_ids}
+        return {'tallies': tallies, 'voters': self.voters}
+
+
+class ResultsPublisher:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+        self.elections = {}
+        self.thread = None
+
+    def load(self, election_id):
+        tallies = dict(CandidateTally.objects.filter(election=election_id).values_list('candidate_id', 'count'))
+        voters = VotedElection.objects.filter(election=election_id).count()
+        return tallies, voters
+
+    def subscribe(self, election_id):
+        '''
+        Returns a Subscription and the current state to send first.
+        '''
+        subscription = Subscription(election_id)
+        loaded = None
+        while True:
+            with self.lock:
+                state = self.elections.get(election_id)
+                if state is None and loaded is not None:
+                    state = self.elections[election_id] = ElectionState()
+                    (state.tallies, state.voters), state.loaded_at = loaded, time.monotonic()
+                if state is not None:
+                    self.subscriptions[election_id].add(subscription)
+                    event = state.as_event()
+                    if self.thread is None or not self.thread.is_alive():
+                        self.thread = threading.Thread(target=self.run, name='live-results', daemon=True)
+                        self.thread.start()
+                    return subscription, event
+            # Not watched yet: load the totals outside the lock, then check
+            # again, since tick() may have dropped the election meanwhile.
+            loaded = self.load(election_id)
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions[subscription.election_id].discard(subscription)
+
+    def record(self, election_id, candidate_ids=(), voters=0):
+        '''
+        Called after a vote commits. Costs a dictionary lookup when nobody is
+        watching the election.
+        '''
+        with self.lock:
+            state = self.elections.get(election_id)
+            if state is None:
+                return
+            state.pending_tallies.update(candidate_ids)
+            state.pending_voters += voters
+
+    def broadcast(self, election_id, event):
+        for subscription in list(self.subscriptions[election_id]):
+            if subscription.stale:
+                continue
+            try:
+                subscription.events.put_nowait(event)
+            except queue.Full:
+                subscription.stale = True
+
+    def tick(self):
+        now = time.monotonic()
+        with self.lock:
+            for election_id in [pk for pk, subscriptions in self.subscriptions.items() if not subscriptions]:
+                del self.subscriptions[election_id]
+                self.elections.pop(election_id, None)
+            watched = dict(self.elections)
+
+        for election_id, state in watched.items():
+            resync = now - state.loaded_at >= settings.LIVE_RESULTS_RESYNC
+            if resync:
+                tallies, voters = self.load(election_id)
+            with self.lock:
+                if resync:
+                    # Reports that arrived while reloading are dropped; the
+                    # reload already counts most of them and the next one
+                    # catches the rest.
+                    changed = {pk for pk, count in tallies.items() if state.tallies.get(pk) != count}
+                    voters_changed = voters != state.voters
+                    state.tallies, state.voters, state.loaded_at = tallies, voters, now
+                    state.pending_tallies.clear()
+                    state.pending_voters = 0
+                else:
+                    changed = set(state.pending_tallies)
+                    voters_changed = bool(state.pending_voters)
+                    for pk, count in state.pending_tallies.items():
+                        state.tallies[pk] = state.tallies.get(pk, 0) + count
+                    state.voters += state.pending_voters
+                    state.pending_tallies.clear()
+                    state.pending_voters = 0
+                for subscription in self.subscriptions[election_id]:
+                    if subscription.stale:
+                        subscription.reset(state.as_event())
+                if changed or voters_changed:
+                    self.broadcast(election_id, state.as_event(changed))
+        connection.close()
+
+    def run(self):
+        while True:
+            time.sleep(settings.LIVE_RESULTS_INTERVAL)
+            try:
+                self.tick()
+            except Exception:
+                logger.exception('Live results update failed')
+
+
+publisher = ResultsPublisher()
@@ -0,0 +1,28 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from institution.archive import ArchiveError, archive_election
+from institution.models import Election
+
+
+class Command(BaseCommand):
+    help = ('Closes an election for voting, freezes its tallies and moves its raw votes from the database to a '
+            'compressed archive file in ELECTION_ARCHIVE_DIR.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('election', type=int, nargs='+', help='Election ids.')
+
+    def handle(self, *args, **options):
+        for pk in options['election']:
+            election = Election.objects.filter(pk=pk).first()
+            if election is None:
+                raise CommandError('No election with id %d.' % pk)
+            try:
+                archive = archive_election(election)
+            except ArchiveError as e:
+                raise CommandError(e)
+            path = os.path.join(settings.ELECTION_ARCHIVE_DIR, archive.path)
+            self.stdout.write(self.style.SUCCESS('Archived %s: %d voters, %d votes to %s (%d bytes, sha256 %s).' % (
+                election, archive.voters, archive.votes, path, os.path.getsize(path), archive.sha256)))
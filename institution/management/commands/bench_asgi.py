@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from institution import bench
+
+
+class Command(BaseCommand):
+    help = ('Runs the same simulated voter load through the WSGI path (sync views, one thread per voter) and the '
+            'ASGI path (async views through AsyncClient, one coroutine per voter) at several concurrency levels.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faculties', type=int, default=2)
+        parser.add_argument('--elections', type=int, default=2, help='Elections per faculty.')
+        parser.add_argument('--positions', type=int, default=5, help='Positions per election.')
+        parser.add_argument('--candidates', type=int, default=3, help='Candidates per position.')
+        parser.add_argument('--students', type=int, default=100, help='Voters per run.')
+        parser.add_argument('--concurrency', type=int, nargs='+', default=[4, 16, 64])
+        parser.add_argument('--ballot-mode', choices=['full', 'wizard'], help='Overrides settings.BALLOT_MODE.')
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help='Use the MD5 hasher so logins do not dominate the run.')
+        parser.add_argument('--database', help='Path of the scratch SQLite file (deleted afterwards).')
+        parser.add_argument('--output', default='bench-asgi.json')
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options['ballot_mode']:
+            overrides['BALLOT_MODE'] = options['ballot_mode']
+        if options['fast_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+        runs = []
+        with override_settings(**overrides), bench.temporary_database(options['database']):
+            # Every run gets its own students: a student can only vote once.
+            usernames = bench.seed(
+                faculties=options['faculties'],
+                elections=options['elections'],
+                positions=options['positions'],
+                candidates=options['candidates'],
+                students=options['students'] * len(options['concurrency']) * 2)
+            batches = iter(usernames[i:i + options['students']] for i in range(0, len(usernames), options['students']))
+
+            for concurrency in options['concurrency']:
+                samples, seconds = bench.run_voters(next(batches), concurrency)
+                runs.append(self.result('wsgi', concurrency, samples, seconds))
+                with bench.async_student_views():
+                    samples, seconds = bench.run_async_voters(next(batches), concurrency)
+                runs.append(self.result('asgi', concurrency, samples, seconds))
+
+            report = {
+                'benchmark': 'asgi',
+                'options': {key: options[key] for key in (
+                    'faculties', 'elections', 'positions', 'candidates', 'students', 'concurrency', 'fast_hasher')},
+                'environment': bench.environment(),
+                'runs': runs,
+            }
+
+        bench.write_report(options['output'], report)
+        self.stdout.write('%-5s %11s %12s %10s %10s %10s %7s' % (
+            'path', 'concurrency', 'voters/sec', 'p50 ms', 'p95 ms', 'p99 ms', 'errors'))
+        for run in runs:
+            stats = run['requests']['all']
+            self.stdout.write('%-5s %11d %12.2f %10.2f %10.2f %10.2f %7d' % (
+                run['path'], run['concurrency'], run['voters_per_second'],
+                stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['errors']))
+        self.stdout.write(self.style.SUCCESS('Report written to %s' % options['output']))
+
+    def result(self, path, concurrency, samples, seconds):
+        voters = sum(1 for label, *_ in samples if label == 'login POST')
+        return {
+            'path': path,
+            'concurrency': concurrency,
+            'seconds': round(seconds, 3),
+            'voters_per_second': round(voters / seconds, 2),
+            'requests_per_second': round(len(samples) / seconds, 2),
+            'requests': bench.summarize(samples),
+        }
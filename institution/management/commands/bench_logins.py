@@ -0,0 +1,78 @@
+import os
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from institution import bench, hashers
+from institution.models import User
+
+
+class Command(BaseCommand):
+    help = ('Measures logins/sec, and logins/sec per core, with passwords hashed on the request threads and in '
+            'hashing pools of several sizes (settings.LOGIN_HASHING_WORKERS).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--students', type=int, default=100, help='Logins per run.')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--workers', type=int, nargs='+', default=[0, os.cpu_count()],
+                            help='LOGIN_HASHING_WORKERS of each run; 0 hashes on the request threads.')
+        parser.add_argument('--iterations', type=int, help='Overrides settings.PASSWORD_ITERATIONS.')
+        parser.add_argument('--seed-iterations', type=int,
+                            help='PBKDF2 iterations of the seeded passwords. When they differ from --iterations, '
+                                 'every login also rehashes the password.')
+        parser.add_argument('--database', help='Path of the scratch SQLite file (deleted afterwards).')
+        parser.add_argument('--output', default='bench-logins.json')
+
+    def handle(self, *args, **options):
+        iterations = options['iterations'] or settings.PASSWORD_ITERATIONS
+        seed_iterations = options['seed_iterations'] or iterations
+        cpus = os.cpu_count()
+
+        runs = []
+        with override_settings(PASSWORD_ITERATIONS=iterations), bench.temporary_database(options['database']):
+            usernames = bench.seed(faculties=1, elections=0, students=options['students'])
+            with override_settings(PASSWORD_ITERATIONS=seed_iterations):
+                seeded = make_password(bench.BENCH_PASSWORD)
+            students = User.objects.filter(is_student=True)
+
+            for workers in options['workers']:
+                students.update(password=seeded)
+                cache.clear()
+                with override_settings(LOGIN_HASHING_WORKERS=workers):
+                    hashers.start()
+                    try:
+                        samples, seconds = bench.run_logins(usernames, options['concurrency'])
+                    finally:
+                        hashers.shutdown()
+                logins = sum(1 for *_, ok in samples if ok)
+                runs.append({
+                    'workers': workers,
+                    'seconds': round(seconds, 3),
+                    'logins_per_second': round(logins / seconds, 2),
+                    'logins_per_second_per_core': round(logins / seconds / cpus, 2),
+                    'rehashed': students.exclude(password=seeded).count(),
+                    'requests': bench.summarize(samples),
+                })
+
+            report = {
+                'benchmark': 'logins',
+                'options': {key: options[key] for key in ('students', 'concurrency', 'workers')},
+                'iterations': iterations,
+                'seed_iterations': seed_iterations,
+                'environment': bench.environment(),
+                'runs': runs,
+            }
+
+        bench.write_report(options['output'], report)
+        self.stdout.write('%d PBKDF2 iterations (seeded with %d), %d cores' % (iterations, seed_iterations, cpus))
+        self.stdout.write('%-7s %11s %16s %10s %10s %9s %7s' % (
+            'workers', 'logins/sec', 'per core/sec', 'p50 ms', 'p95 ms', 'rehashed', 'errors'))
+        for run in runs:
+            stats = run['requests']['all']
+            self.stdout.write('%-7d %11.2f %16.2f %10.2f %10.2f %9d %7d' % (
+                run['workers'], run['logins_per_second'], run['logins_per_second_per_core'],
+                stats['p50_ms'], stats['p95_ms'], run['rehashed'], stats['errors']))
+        self.stdout.write(self.style.SUCCESS('Report written to %s' % options['output']))
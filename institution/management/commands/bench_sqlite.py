@@ -0,0 +1,81 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings
+
+from institution import bench
+from institution.models import StudentVote
+
+
+class Command(BaseCommand):
+    help = ('Compares settings.SQLITE_PROFILES under mixed load: students vote while EC officers keep reloading the '
+            'results pages. Each profile gets its own scratch database.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faculties', type=int, default=2)
+        parser.add_argument('--elections', type=int, default=2, help='Elections per faculty.')
+        parser.add_argument('--positions', type=int, default=5, help='Positions per election.')
+        parser.add_argument('--candidates', type=int, default=3, help='Candidates per position.')
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8, help='Voters in flight at once.')
+        parser.add_argument('--readers', type=int, default=4, help='EC officers reloading the results.')
+        parser.add_argument('--profiles', nargs='+', default=['default', 'production'])
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help='Use the MD5 hasher so logins do not dominate the run.')
+        parser.add_argument('--database', help='Path of the scratch SQLite file (deleted afterwards).')
+        parser.add_argument('--output', default='bench-sqlite.json')
+
+    def handle(self, *args, **options):
+        unknown = set(options['profiles']) - set(settings.SQLITE_PROFILES)
+        if unknown:
+            raise CommandError('Unknown SQLite profile(s): %s' % ', '.join(sorted(unknown)))
+        overrides = {}
+        if options['fast_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+        runs = []
+        for name in options['profiles']:
+            with override_settings(**overrides), bench.temporary_database(options['database']), \
+                    bench.sqlite_profile(name):
+                usernames = bench.seed(
+                    faculties=options['faculties'],
+                    elections=options['elections'],
+                    positions=options['positions'],
+                    candidates=options['candidates'],
+                    students=options['students'])
+                samples, seconds = bench.run_voters(usernames, options['concurrency'], readers=options['readers'])
+                votes = StudentVote.objects.count()
+                with connection.cursor() as cursor:
+                    journal_mode = cursor.execute('PRAGMA journal_mode').fetchone()[0]
+                requests = bench.summarize(samples)
+                reads = requests.get('ec:election_results', {}).get('requests', 0)
+                runs.append({
+                    'profile': name,
+                    'journal_mode': journal_mode,
+                    'conn_max_age': settings.DATABASES['default']['CONN_MAX_AGE'],
+                    'seconds': round(seconds, 3),
+                    'votes': votes,
+                    'votes_per_second': round(votes / seconds, 2),
+                    'results_per_second': round(reads / seconds, 2),
+                    'requests': requests,
+                })
+
+        report = {
+            'benchmark': 'sqlite',
+            'options': {key: options[key] for key in (
+                'faculties', 'elections', 'positions', 'candidates', 'students', 'concurrency', 'readers',
+                'fast_hasher')},
+            'environment': bench.environment(),
+            'runs': runs,
+        }
+        bench.write_report(options['output'], report)
+
+        self.stdout.write('%-12s %-8s %10s %12s %14s %14s %7s' % (
+            'profile', 'journal', 'votes/sec', 'results/sec', 'vote p95 ms', 'results p95 ms', 'errors'))
+        for run in runs:
+            requests = run['requests']
+            self.stdout.write('%-12s %-8s %10.2f %12.2f %14.2f %14.2f %7d' % (
+                run['profile'], run['journal_mode'], run['votes_per_second'], run['results_per_second'],
+                requests['students:vote POST']['p95_ms'], requests['ec:election_results']['p95_ms'],
+                requests['all']['errors']))
+        self.stdout.write(self.style.SUCCESS('Report written to %s' % options['output']))
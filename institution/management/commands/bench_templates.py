@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from institution import bench
+from institution.models import User
+
+
+class Command(BaseCommand):
+    help = ('Measures the template render time of the election list and the ballot page with the plain template '
+            'loaders, with the cached loader, and with the cached loader plus fragment caching.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--elections', type=int, default=4, help='Elections on each student\'s list.')
+        parser.add_argument('--positions', type=int, default=5, help='Positions per election.')
+        parser.add_argument('--candidates', type=int, default=4, help='Candidates per position.')
+        parser.add_argument('--students', type=int, default=20)
+        parser.add_argument('--repeat', type=int, default=10, help='Times each student loads each page.')
+        parser.add_argument('--database', help='Path of the scratch SQLite file (deleted afterwards).')
+        parser.add_argument('--output', default='bench-templates.json')
+
+    def get_modes(self):
+        timeout = settings.FRAGMENT_CACHE_TIMEOUT or 60 * 60
+        return [
+            ('plain loaders', {'TEMPLATES': bench.template_settings(cached=False), 'FRAGMENT_CACHE_TIMEOUT': 0}),
+            ('cached loader', {'TEMPLATES': bench.template_settings(cached=True), 'FRAGMENT_CACHE_TIMEOUT': 0}),
+            ('cached loader + fragments', {
+                'TEMPLATES': bench.template_settings(cached=True), 'FRAGMENT_CACHE_TIMEOUT': timeout}),
+        ]
+
+    def load_pages(self, clients, election_ids, repeat, samples, renders):
+        for client in clients:
+            pages = [('students:election_list', reverse('students:election_list'))] + [
+                ('students:vote GET', reverse('students:vote', args=[pk])) for pk in election_ids
+            ]
+            for _ in range(repeat):
+                for label, url in pages:
+                    response, seconds, render_seconds = bench.timed_get(client, url)
+                    ok = response.status_code == 200
+                    if samples is not None:
+                        samples.append((label, seconds, None, ok))
+                        renders.append((label, render_seconds, None, ok))
+
+    def handle(self, *args, **options):
+        runs = []
+        with bench.temporary_database(options['database']):
+            usernames = bench.seed(
+                faculties=1,
+                elections=options['elections'],
+                positions=options['positions'],
+                candidates=options['candidates'],
+                students=options['students'])
+            ballots, _ = bench.load_ballots()
+            clients = []
+            for user in User.objects.filter(username__in=usernames):
+                client = Client()
+                client.force_login(user)
+                clients.append(client)
+
+            for name, overrides in self.get_modes():
+                with override_settings(**overrides):
+                    cache.clear()
+                    # One untimed pass, as a server would have served before.
+                    self.load_pages(clients[:1], sorted(ballots), 1, None, None)
+                    samples, renders = [], []
+                    self.load_pages(clients, sorted(ballots), options['repeat'], samples, renders)
+                runs.append({
+                    'mode': name,
+                    'fragment_cache_timeout': overrides['FRAGMENT_CACHE_TIMEOUT'],
+                    'requests': bench.summarize(samples),
+                    'render': bench.summarize(renders),
+                })
+
+        report = {
+            'benchmark': 'templates',
+            'options': {key: options[key] for key in (
+                'elections', 'positions', 'candidates', 'students', 'repeat')},
+            'environment': bench.environment(),
+            'runs': runs,
+        }
+        bench.write_report(options['output'], report)
+
+        baseline = runs[0]['render']
+        self.stdout.write('%-27s %-24s %14s %14s %10s' % ('mode', 'page', 'render p50 ms', 'request p50 ms', 'render -%'))
+        for run in runs:
+            for label in ('students:election_list', 'students:vote GET'):
+                render = run['render'][label]['p50_ms']
+                self.stdout.write('%-27s %-24s %14.2f %14.2f %9.0f%%' % (
+                    run['mode'], label, render, run['requests'][label]['p50_ms'],
+                    100 * (1 - render / baseline[label]['p50_ms']) if baseline[label]['p50_ms'] else 0))
+        self.stdout.write(self.style.SUCCESS('Report written to %s' % options['output']))
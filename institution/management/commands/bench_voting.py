@@ -0,0 +1,76 @@
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+
+from institution import bench, journal
+from institution.models import StudentVote
+
+
+class Command(BaseCommand):
+    help = ('Simulates polling day against a scratch database: N students log in, list their elections, vote in '
+            'all of them and check the completed list, several at a time. Writes latency percentiles, queries per '
+            'request and votes/sec to a JSON report.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--faculties', type=int, default=2)
+        parser.add_argument('--elections', type=int, default=2, help='Elections per faculty.')
+        parser.add_argument('--positions', type=int, default=5, help='Positions per election.')
+        parser.add_argument('--candidates', type=int, default=3, help='Candidates per position.')
+        parser.add_argument('--students', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=8, help='Voters in flight at once.')
+        parser.add_argument('--ballot-mode', choices=['full', 'wizard'], help='Overrides settings.BALLOT_MODE.')
+        parser.add_argument('--ingestion', choices=['direct', 'journal'], help='Overrides settings.VOTE_INGESTION.')
+        parser.add_argument('--cached-auth', action='store_true',
+                            help='Read sessions and user profiles from the cache (settings.CACHED_AUTH).')
+        parser.add_argument('--fast-hasher', action='store_true',
+                            help='Use the MD5 hasher so logins do not dominate the run.')
+        parser.add_argument('--database', help='Path of the scratch SQLite file (deleted afterwards).')
+        parser.add_argument('--output', default='bench-voting.json')
+
+    def handle(self, *args, **options):
+        overrides = {}
+        if options['ballot_mode']:
+            overrides['BALLOT_MODE'] = options['ballot_mode']
+        if options['fast_hasher']:
+            overrides['PASSWORD_HASHERS'] = ['django.contrib.auth.hashers.MD5PasswordHasher']
+        if options['ingestion']:
+            overrides['VOTE_INGESTION'] = options['ingestion']
+        if options['cached_auth']:
+            overrides.update(settings.CACHED_AUTH_SETTINGS, CACHED_AUTH=True)
+        journal_dir = overrides['VOTE_JOURNAL_DIR'] = tempfile.mkdtemp(prefix='bench-journal-')
+
+        with override_settings(**overrides), bench.temporary_database(options['database']):
+            usernames = bench.seed(
+                faculties=options['faculties'],
+                elections=options['elections'],
+                positions=options['positions'],
+                candidates=options['candidates'],
+                students=options['students'])
+            samples, seconds = bench.run_voters(usernames, options['concurrency'])
+            # Ballots still queued when their voter gave up waiting count too.
+            journal.drain()
+            votes = StudentVote.objects.count()
+            report = {
+                'benchmark': 'voting',
+                'options': {key: options[key] for key in (
+                    'faculties', 'elections', 'positions', 'candidates', 'students', 'concurrency', 'fast_hasher',
+                    'ingestion', 'cached_auth')},
+                'environment': bench.environment(),
+                'seconds': round(seconds, 3),
+                'votes': votes,
+                'votes_per_second': round(votes / seconds, 2),
+                'requests_per_second': round(len(samples) / seconds, 2),
+                'requests': bench.summarize(samples),
+            }
+        shutil.rmtree(journal_dir)
+
+        bench.write_report(options['output'], report)
+        for label, stats in report['requests'].items():
+            self.stdout.write('%-32s n=%-6d p50=%8.2fms p95=%8.2fms p99=%8.2fms queries=%5.1f errors=%d' % (
+                label, stats['requests'], stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+                stats['queries_per_request'], stats['errors']))
+        self.stdout.write(self.style.SUCCESS('%d votes in %.1fs (%.1f votes/sec). Report written to %s' % (
+            votes, seconds, report['votes_per_second'], options['output'])))
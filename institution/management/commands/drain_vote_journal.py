@@ -0,0 +1,37 @@
+import os
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from institution import journal
+
+
+class Command(BaseCommand):
+    help = ('Saves the ballots waiting in the vote journal (VOTE_INGESTION = "journal"). Voters\' requests do this '
+            'themselves; run it after a crash, or keep it running to save ballots whose voter stopped waiting.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--watch', action='store_true', help='Keep draining until interrupted.')
+        parser.add_argument('--status', action='store_true', help='Only report the backlog.')
+
+    def handle(self, *args, **options):
+        if options['status']:
+            path = journal.journal_path(journal.JOURNAL_FILE)
+            size = os.path.getsize(path) if os.path.exists(path) else 0
+            self.stdout.write('Journal: %s (%d bytes), saved up to byte %d, %d ballots waiting.' % (
+                path, size, journal.read_checkpoint(), len(journal.backlog())))
+            return
+
+        if not options['watch']:
+            with journal.writer_lock(block=True):
+                count = journal.drain()
+            self.stdout.write(self.style.SUCCESS('Saved %d journal entries.' % count))
+            return
+
+        try:
+            while True:
+                journal.try_drain()
+                time.sleep(settings.VOTE_JOURNAL_INTERVAL)
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,43 @@
+import json
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from institution import stats
+
+
+class Command(BaseCommand):
+    help = 'Merges the request statistics flushed by every web process and prints them per URL name.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--json', action='store_true', help='Print JSON instead of a table.')
+        parser.add_argument('--max-age', type=int, default=settings.REQUEST_STATS_WINDOW * 60,
+                            help='Ignore snapshots older than this many seconds (processes that have stopped).')
+        parser.add_argument('--slow-queries', action='store_true', help='Also print the sampled slow queries.')
+
+    def handle(self, *args, **options):
+        snapshots = stats.load_snapshots(max_age=options['max_age'])
+        views, slow_queries = stats.merge_snapshots(snapshots)
+        rows = stats.summarize(views)
+
+        if options['json']:
+            self.stdout.write(json.dumps({
+                'processes': len(snapshots),
+                'views': rows,
+                'slow_queries': slow_queries if options['slow_queries'] else {},
+            }, indent=2))
+            return
+
+        self.stdout.write('%d process snapshots from %s' % (len(snapshots), settings.REQUEST_STATS_DIR))
+        self.stdout.write('%-36s %8s %8s %8s %8s %9s %9s %8s' % (
+            'view', 'requests', 'p50 ms', 'p95 ms', 'p99 ms', 'db ms', 'tmpl ms', 'queries'))
+        for row in rows:
+            self.stdout.write('%-36s %8d %8s %8s %8s %9.2f %9.2f %8.1f' % (
+                row['view'], row['requests'],
+                row['wall_p50_ms'] or '>10000', row['wall_p95_ms'] or '>10000', row['wall_p99_ms'] or '>10000',
+                row['db_mean_ms'], row['template_mean_ms'], row['queries_mean']))
+
+        if options['slow_queries']:
+            for view_name, queries in sorted(slow_queries.items()):
+                for query in sorted(queries, key=lambda query: -query['ms'])[:5]:
+                    self.stdout.write('\n%s %.3fms %s\n%s' % (view_name, query['ms'], query['sql'], ''.join(query['stack'])))
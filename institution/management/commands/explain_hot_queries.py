@@ -0,0 +1,86 @@
+from types import SimpleNamespace
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from institution.eligibility import open_elections_queryset
+from institution.models import Election, Student, StudentVote, VotedElection
+from institution.views.students import VotedElectionListView
+
+
+# Tables that grow with the electorate. A full scan of any of them on a hot
+# path is a regression; scanning the small EC-managed tables is fine.
+LARGE_TABLES = (
+    'institution_studentvote',
+    'institution_votedelection',
+    'institution_candidatetally',
+    'institution_student',
+    'institution_user',
+)
+
+
+class Command(BaseCommand):
+    help = 'Prints the SQLite query plan of every query on the voting hot path and flags full table scans.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--student', type=int, help='Student (user) id to plan with. Defaults to the first student.')
+        parser.add_argument('--election', type=int, help='Election id to plan with. Defaults to the first election.')
+        parser.add_argument('--output', help='Also write the report to this file.')
+
+    def get_queries(self, student, election):
+        voted_list = VotedElectionListView()
+        voted_list.request = SimpleNamespace(user=student.user)
+        return [
+            ('students.vote: progress (cache miss), voted positions',
+                StudentVote.objects.filter(student=student.pk, election=election.pk).values_list('position_id')),
+            ('students.vote: progress (cache miss), already voted',
+                VotedElection.objects.filter(student=student.pk, election=election.pk)),
+            ('students.vote: ballot snapshot',
+                election.positions.order_by('text', 'pk')),
+            ('students:election_list (cache miss)',
+                open_elections_queryset(student.pk, student.faculty.values_list('pk', flat=True))),
+            ('students:voted_elections_list',
+                voted_list.get_queryset()),
+            ('ec:election_results: voters',
+                election.voted_elections.select_related('student__user').order_by('-date')),
+            ('ec:election_results: tallies',
+                election.tallies.select_related('position', 'candidate')
+                .order_by('position__text', 'position', '-count', 'candidate__full_name')),
+        ]
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'sqlite':
+            raise CommandError('The query plan report is written for SQLite, not %s.' % connection.vendor)
+
+        # The planner only needs ids, so unsaved placeholders work on an
+        # empty database.
+        student = Student.objects.select_related('user').filter(pk=options['student']).first() \
+            if options['student'] else Student.objects.select_related('user').first()
+        student = student or Student(pk=1, user_id=1)
+        election = Election.objects.filter(pk=options['election']).first() \
+            if options['election'] else Election.objects.first()
+        election = election or Election(pk=1)
+
+        lines, failures = [], 0
+        for label, queryset in self.get_queries(student, election):
+            plan = queryset.explain()
+            scans = [
+                step for step in plan.splitlines()
+                if ' SCAN ' in ' %s ' % step and 'COVERING INDEX' not in step and
+                any(table in step for table in LARGE_TABLES)
+            ]
+            failures += bool(scans)
+            lines.append('%s [%s]' % (label, 'FULL SCAN' if scans else 'indexed'))
+            lines.append(str(queryset.query))
+            lines.extend('    %s' % step for step in plan.splitlines())
+            lines.append('')
+
+        report = '\n'.join(lines)
+        self.stdout.write(report)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(report)
+
+        if failures:
+            raise CommandError('%d hot queries scan a large table.' % failures)
+        self.stdout.write(self.style.SUCCESS('All hot queries use an index.'))
@@ -0,0 +1,136 @@
+import csv
+import itertools
+import json
+import os
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from institution.models import Faculty, Student, User
+from institution.workers import process_pool
+
+
+def hash_password(password):
+    return make_password(password or None)
+
+
+class Command(BaseCommand):
+    help = 'Registers students in bulk from a CSV or JSONL roll. Students whose student_number already exists are skipped.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('roll', help='CSV (with a header row) or JSONL file. Columns: username, student_number, '
+                                         'faculties (names or ids, ";"-separated), and optionally password, mobile, '
+                                         'email, first_name, last_name.')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension.')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Rows per transaction. Keep it under 999 for older SQLite builds.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes used to hash passwords.')
+
+    def read_roll(self, path, roll_format):
+        with open(path, newline='') as f:
+            if roll_format == 'csv':
+                yield from csv.DictReader(f)
+            else:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+    def handle(self, *args, **options):
+        roll_format = options['format'] or ('jsonl' if options['roll'].endswith(('.jsonl', '.ndjson')) else 'csv')
+        self.faculties = {}
+        for pk, name in Faculty.objects.values_list('pk', 'name'):
+            self.faculties[str(pk)] = pk
+            self.faculties[name.lower()] = pk
+
+        self.created = self.skipped = 0
+        self.workers = options['workers']
+        self.seen = set()
+        self.seen_usernames = set()
+        started = time.monotonic()
+        rows = self.read_roll(options['roll'], roll_format)
+        with process_pool(self.workers) as pool:
+            while True:
+                chunk = list(itertools.islice(rows, options['chunk_size']))
+                if not chunk:
+                    break
+                self.import_chunk(chunk, pool)
+                elapsed = time.monotonic() - started
+                self.stdout.write('%d created, %d skipped (%.0f rows/sec)' % (
+                    self.created, self.skipped, (self.created + self.skipped) / elapsed))
+
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS('Imported %d students in %.1fs (%.0f rows/sec), skipped %d.' % (
+            self.created, elapsed, (self.created + self.skipped) / elapsed if elapsed else 0, self.skipped)))
+
+    def clean_rows(self, chunk):
+        student_numbers = [(row.get('student_number') or '').strip() for row in chunk]
+        usernames = [(row.get('username') or '').strip() for row in chunk]
+        existing_numbers = set(
+            Student.objects.filter(student_number__in=student_numbers).values_list('student_number', flat=True))
+        existing_usernames = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+
+        rows = []
+        for row in chunk:
+            student_number = (row.get('student_number') or '').strip()
+            username = (row.get('username') or '').strip()
+            if not student_number or not username:
+                self.stderr.write('Skipping row without username or student_number: %r' % row)
+                self.skipped += 1
+                continue
+            if student_number in existing_numbers or student_number in self.seen:
+                self.skipped += 1
+                continue
+            if username in existing_usernames or username in self.seen_usernames:
+                self.stderr.write('Skipping %s: username %s is taken' % (student_number, username))
+                self.skipped += 1
+                continue
+            faculties = row.get('faculties') or ''
+            if isinstance(faculties, str):
+                faculties = [faculty.strip() for faculty in faculties.split(';') if faculty.strip()]
+            try:
+                faculty_ids = {self.faculties[str(faculty).lower()] for faculty in faculties}
+            except KeyError as e:
+                self.stderr.write('Skipping %s: unknown faculty %s' % (student_number, e))
+                self.skipped += 1
+                continue
+            self.seen.add(student_number)
+            self.seen_usernames.add(username)
+            rows.append((row, username, student_number, faculty_ids))
+        return rows
+
+    def import_chunk(self, chunk, pool):
+        rows = self.clean_rows(chunk)
+        if not rows:
+            return
+        passwords = pool.map(hash_password, [row.get('password') for row, *_ in rows],
+                             chunksize=max(1, len(rows) // (self.workers * 4)))
+
+        with transaction.atomic():
+            User.objects.bulk_create([
+                User(
+                    username=username,
+                    password=password,
+                    email=row.get('email') or '',
+                    first_name=row.get('first_name') or '',
+                    last_name=row.get('last_name') or '',
+                    is_student=True,
+                )
+                for (row, username, student_number, faculty_ids), password in zip(rows, passwords)
+            ])
+            # SQLite does not return the new primary keys from bulk_create.
+            user_ids = dict(User.objects.filter(username__in=[username for _, username, *_ in rows])
+                            .values_list('username', 'pk'))
+            Student.objects.bulk_create([
+                Student(user_id=user_ids[username], student_number=student_number, mobile=row.get('mobile') or None)
+                for row, username, student_number, faculty_ids in rows
+            ])
+            StudentFaculty = Student.faculty.through
+            StudentFaculty.objects.bulk_create([
+                StudentFaculty(student_id=user_ids[username], faculty_id=faculty_id)
+                for row, username, student_number, faculty_ids in rows
+                for faculty_id in faculty_ids
+            ])
+        self.created += len(rows)
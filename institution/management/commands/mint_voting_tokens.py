@@ -0,0 +1,54 @@
+import csv
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from institution.models import Election, Student
+from institution.tokens import make_token
+
+
+class Command(BaseCommand):
+    help = ('Mints a voting token for every student of each election\'s faculty and writes them, with the ballot '
+            'links, to a CSV file for the EC to send out.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--election', type=int, nargs='+', help='Election ids. Defaults to every election.')
+        parser.add_argument('--base-url', default='', help='Prefix of the ballot links, e.g. https://vote.example.ac.ug')
+        parser.add_argument('--skip-voted', action='store_true', help='Leave out students who have already voted.')
+        parser.add_argument('--output', default='-', help='CSV file to write; "-" for standard output.')
+
+    def handle(self, *args, **options):
+        if not settings.VOTING_TOKENS:
+            self.stderr.write(self.style.WARNING(
+                'VOTING_TOKENS is off: the tokens will not open a ballot until it is turned on.'))
+        elections = Election.objects.order_by('pk')
+        if options['election']:
+            elections = elections.filter(pk__in=options['election'])
+            missing = set(options['election']) - set(elections.values_list('pk', flat=True))
+            if missing:
+                raise CommandError('No election with id %s.' % ', '.join(map(str, sorted(missing))))
+
+        output = self.stdout if options['output'] == '-' else open(options['output'], 'w', newline='')
+        started = time.monotonic()
+        minted = 0
+        try:
+            writer = csv.writer(output)
+            writer.writerow(['student_number', 'username', 'email', 'mobile', 'election_id', 'election', 'url'])
+            for election in elections:
+                students = Student.objects.filter(faculty=election.faculty_id).order_by('pk')
+                if options['skip_voted']:
+                    students = students.exclude(elections=election)
+                rows = students.values_list('pk', 'student_number', 'user__username', 'user__email', 'mobile')
+                for pk, student_number, username, email, mobile in rows.iterator():
+                    url = reverse('students:token_vote', args=[make_token(pk, election.pk)])
+                    writer.writerow([student_number, username, email, mobile, election.pk, election.name,
+                                     options['base_url'] + url])
+                    minted += 1
+        finally:
+            if output is not self.stdout:
+                output.close()
+
+        elapsed = time.monotonic() - started
+        self.stderr.write(self.style.SUCCESS('Minted %d tokens in %.1fs.' % (minted, elapsed)))
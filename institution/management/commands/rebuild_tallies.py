@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from institution.models import Candidate, CandidateTally, ElectionArchive, StudentVote, TurnoutCount, VotedElection
+from institution.turnout import count_turnout
+
+
+class Command(BaseCommand):
+    help = ('Recounts the candidate tallies from the raw StudentVote rows, and the turnout counts from the '
+            'VotedElection rows, and fixes any drift. The tallies of archived elections are checked against '
+            'their archives instead, and their turnout is left alone.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--election', type=int, help='Only reconcile the election with this id.')
+        parser.add_argument('--dry-run', action='store_true', help='Report mismatches without writing them.')
+
+    def handle(self, *args, **options):
+        candidates = Candidate.objects.select_related('position')
+        votes = StudentVote.objects.all()
+        voted_elections = VotedElection.objects.all()
+        turnout = TurnoutCount.objects.all()
+        archives = ElectionArchive.objects.all()
+        if options['election']:
+            candidates = candidates.filter(position__election=options['election'])
+            votes = votes.filter(election=options['election'])
+            voted_elections = voted_elections.filter(election=options['election'])
+            turnout = turnout.filter(election=options['election'])
+            archives = archives.filter(election=options['election'])
+        # An archived election's raw rows are in its archive file, if they
+        # are not restored, so only its frozen tallies can be trusted.
+        votes = votes.filter(election__archive__isnull=True)
+        voted_elections = voted_elections.filter(election__archive__isnull=True)
+        turnout = turnout.filter(election__archive__isnull=True)
+
+        with transaction.atomic():
+            counts = dict(votes.values('candidate').annotate(votes=Count('pk')).values_list('candidate', 'votes'))
+            for archive in archives:
+                counts.update((row['candidate_id'], row['votes']) for row in archive.tallies)
+            tallies = {
+                tally.candidate_id: tally
+                for tally in CandidateTally.objects.select_for_update().filter(candidate__in=candidates)
+            }
+
+            missing, drifted = [], []
+            for candidate in candidates:
+                expected = counts.get(candidate.pk, 0)
+                tally = tallies.get(candidate.pk)
+                if tally is None:
+                    missing.append(CandidateTally(
+                        election_id=candidate.position.election_id,
+                        position_id=candidate.position_id,
+                        candidate=candidate,
+                        count=expected,
+                    ))
+                elif tally.count != expected:
+                    self.stdout.write('%s: tally %d, counted %d' % (candidate, tally.count, expected))
+                    tally.count = expected
+                    drifted.append(tally)
+
+            expected_turnout = count_turnout(voted_elections)
+            counted_turnout = {
+                (row.election_id, row.faculty_id, row.minute): row.voters for row in turnout.select_for_update()
+            }
+            drifted_buckets = [
+                key for key in expected_turnout.keys() | counted_turnout.keys()
+                if expected_turnout.get(key) != counted_turnout.get(key)
+            ]
+            if drifted_buckets:
+                self.stdout.write('Turnout: %d of %d minute buckets drifted' % (
+                    len(drifted_buckets), len(expected_turnout)))
+
+            if not options['dry_run']:
+                CandidateTally.objects.bulk_create(missing)
+                CandidateTally.objects.bulk_update(drifted, ['count'])
+                if drifted_buckets:
+                    turnout.delete()
+                    TurnoutCount.objects.bulk_create([
+                        TurnoutCount(election_id=election_id, faculty_id=faculty_id, minute=minute, voters=voters)
+                        for (election_id, faculty_id, minute), voters in expected_turnout.items()
+                    ], batch_size=500)
+
+        self.stdout.write(self.style.SUCCESS(
+            'Checked %d candidates (%d archived elections against their archives): %d tallies created, '
+            '%d corrected; turnout %s%s.' % (
+                len(candidates), len(archives), len(missing), len(drifted),
+                'recounted' if drifted_buckets else 'correct', ' (dry run)' if options['dry_run'] else '')
+        ))
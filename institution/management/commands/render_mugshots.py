@@ -0,0 +1,59 @@
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from PIL import Image
+
+from institution import mugshots
+from institution.ballot import invalidate_ballot
+from institution.models import Candidate
+from institution.workers import process_pool
+
+
+def render_mugshot(name):
+    '''
+    Returns (digest, error) for the stored mugshot `name`.
+    '''
+    try:
+        with default_storage.open(name, 'rb') as f:
+            return mugshots.render(f), None
+    except (OSError, Image.DecompressionBombError) as e:
+        return '', str(e)
+
+
+class Command(BaseCommand):
+    help = 'Renders the thumbnails of candidate mugshots uploaded before thumbnails were rendered on upload.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Also candidates that already have thumbnails, e.g. after changing MUGSHOT_SIZE.')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Processes used to render thumbnails.')
+
+    def handle(self, *args, **options):
+        candidates = Candidate.objects.exclude(mugshot='').exclude(mugshot=None)
+        if not options['all']:
+            candidates = candidates.filter(mugshot_digest='')
+        candidates = list(candidates.values_list('pk', 'mugshot', 'position__election_id'))
+
+        started = time.monotonic()
+        rendered = failed = 0
+        elections = set()
+        with process_pool(options['workers']) as pool:
+            results = pool.map(render_mugshot, [name for _, name, _ in candidates])
+            for (pk, name, election_id), (digest, error) in zip(candidates, results):
+                if error:
+                    self.stderr.write('Skipping candidate %d: %s: %s' % (pk, name, error))
+                    failed += 1
+                    continue
+                # update() sends no post_save, so the ballots are invalidated
+                # below.
+                Candidate.objects.filter(pk=pk).update(mugshot_digest=digest)
+                elections.add(election_id)
+                rendered += 1
+
+        for election_id in elections:
+            invalidate_ballot(election_id)
+        self.stdout.write(self.style.SUCCESS('Rendered the thumbnails of %d mugshots in %.1fs, %d failed.' % (
+            rendered, time.monotonic() - started, failed)))
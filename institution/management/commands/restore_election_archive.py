@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from institution.archive import ArchiveError, read_archive, restore_election
+from institution.models import ElectionArchive
+
+
+class Command(BaseCommand):
+    help = ('Puts the raw votes of an archived election back into the database for an audit, after checking the '
+            'archive file against its recorded SHA-256. The election stays closed for voting.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('election', type=int, help='Election id.')
+        parser.add_argument('--check', action='store_true',
+                            help='Only check the archive file and compare it with the recorded counts.')
+
+    def handle(self, *args, **options):
+        archive = ElectionArchive.objects.select_related('election').filter(election=options['election']).first()
+        if archive is None:
+            raise CommandError('Election %d has not been archived.' % options['election'])
+        try:
+            if options['check']:
+                self.check_archive(archive)
+                return
+            voters, votes = restore_election(archive)
+        except ArchiveError as e:
+            raise CommandError(e)
+        self.stdout.write(self.style.SUCCESS('Restored %d voters and %d votes of %s.' % (
+            voters, votes, archive.election)))
+
+    def check_archive(self, archive):
+        counts = {'voter': 0, 'vote': 0}
+        for record in read_archive(archive):
+            if record['type'] in counts:
+                counts[record['type']] += 1
+        if (counts['voter'], counts['vote']) != (archive.voters, archive.votes):
+            raise CommandError('%s holds %d voters and %d votes; %d and %d were archived.' % (
+                archive.path, counts['voter'], counts['vote'], archive.voters, archive.votes))
+        self.stdout.write(self.style.SUCCESS('%s is intact: %d voters, %d votes.' % (
+            archive.path, archive.voters, archive.votes)))
@@ -0,0 +1,42 @@
+import sqlite3
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from institution.routers import REPLICA
+
+
+class Command(BaseCommand):
+    help = ('Copies the SQLite primary database into the replica (DATABASES["replica"]), once or every --interval '
+            'seconds. Stands in for replication when trying the read replica locally with two SQLite files.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, help='Keep copying, this many seconds apart.')
+
+    def handle(self, *args, **options):
+        if REPLICA not in settings.DATABASES:
+            raise CommandError('No replica configured; set DIGITAL_VOTING_REPLICA_DB.')
+        primary, replica = settings.DATABASES['default'], settings.DATABASES[REPLICA]
+        if primary['ENGINE'] != replica['ENGINE'] or not primary['ENGINE'].endswith('sqlite3'):
+            raise CommandError('sync_replica only copies between SQLite databases.')
+
+        try:
+            while True:
+                started = time.monotonic()
+                source = sqlite3.connect(primary['NAME'])
+                target = sqlite3.connect(replica['NAME'])
+                try:
+                    # The backup API copies a consistent snapshot while the
+                    # primary keeps taking writes.
+                    source.backup(target)
+                finally:
+                    target.close()
+                    source.close()
+                self.stdout.write('Copied %s to %s in %.2fs.' % (
+                    primary['NAME'], replica['NAME'], time.monotonic() - started))
+                if not options['interval']:
+                    break
+                time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,40 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from institution import ledger
+from institution.models import Election
+
+
+class Command(BaseCommand):
+    help = ('Checks the hash chain of each election\'s vote ledger from the last checkpoint on, and the saved votes '
+            'of the students in the new entries against it, then records a checkpoint.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--election', type=int, nargs='+', help='Election ids. Defaults to every election.')
+        parser.add_argument('--full', action='store_true',
+                            help='Check every entry and every checkpoint, not just what was added since the last run.')
+        parser.add_argument('--no-checkpoint', action='store_true', help='Do not record a checkpoint.')
+
+    def handle(self, *args, **options):
+        elections = Election.objects.order_by('pk')
+        if options['election']:
+            elections = elections.filter(pk__in=options['election'])
+            missing = set(options['election']) - set(elections.values_list('pk', flat=True))
+            if missing:
+                raise CommandError('No election with id %s.' % ', '.join(map(str, sorted(missing))))
+
+        failed = []
+        for election in elections:
+            started = time.monotonic()
+            checked, problems = ledger.verify(election, full=options['full'],
+                                              checkpoint=not options['no_checkpoint'])
+            elapsed = time.monotonic() - started
+            if problems:
+                failed.append(election)
+                for problem in problems:
+                    self.stderr.write(self.style.ERROR('%s: %s' % (election, problem)))
+            else:
+                self.stdout.write(self.style.SUCCESS('%s: %d entries checked in %.2fs.' % (election, checked, elapsed)))
+        if failed:
+            raise CommandError('The ledger of %s does not match.' % ', '.join(map(str, failed)))
@@ -0,0 +1,225 @@
+import mimetypes
+import os
+import random
+import threading
+import time
+import traceback
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.exceptions import MiddlewareNotUsed, SuspiciousFileOperation
+from django.db import connections
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from . import routers
+from .stats import registry
+
+_local = threading.local()
+
+
+def project_frames():
+    # Django's own frames say nothing about which view issued the query.
+    return [
+        frame for frame in traceback.extract_stack()[:-2]
+        if frame.filename.startswith(settings.BASE_DIR) and 'site-packages' not in frame.filename
+        and frame.filename != __file__
+    ]
+
+
+class RequestRecord:
+    def __init__(self, sample_queries):
+        self.queries = 0
+        self.db = 0.0
+        self.template = 0.0
+        self.template_depth = 0
+        self.sample_queries = sample_queries
+        self.slow_queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            self.queries += 1
+            self.db += elapsed
+            if self.sample_queries:
+                self.slow_queries.append({
+                    'ms': round(elapsed * 1000, 3),
+                    'sql': sql,
+                    'stack': traceback.format_list(project_frames()),
+                })
+
+
+def instrument_templates():
+    '''
+    Times the outermost template render of each request. Both render() and
+    TemplateResponse go through the backend Template, so wrapping its
+    render() once covers every view.
+    '''
+    from django.template.backends.django import Template
+
+    if getattr(Template.render, 'instrumented', False):
+        return
+    original_render = Template.render
+
+    def render(self, context=None, request=None):
+        record = getattr(_local, 'record', None)
+        if record is None:
+            return original_render(self, context, request)
+        record.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return original_render(self, context, request)
+        finally:
+            record.template_depth -= 1
+            if not record.template_depth:
+                record.template += time.perf_counter() - started
+
+    render.instrumented = True
+    Template.render = render
+
+
+class RequestStatsMiddleware:
+    '''
+    Records query count, DB time, template render time and wall time for
+    every request, grouped by URL name, into the in-memory histograms of
+    institution.stats. Only enabled when settings.REQUEST_STATS is true.
+
+    Per-query SQL and stacks are only captured for the fraction of requests
+    given by REQUEST_STATS_SAMPLE_RATE. Queries and templates of the async
+    student views run in other threads and are not seen.
+    '''
+
+    def __init__(self, get_response):
+        if not settings.REQUEST_STATS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        instrument_templates()
+
+    def __call__(self, request):
+        sample_queries = random.random() < settings.REQUEST_STATS_SAMPLE_RATE
+        record = _local.record = RequestRecord(sample_queries)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(connections[alias].execute_wrapper(record))
+                response = self.get_response(request)
+        finally:
+            _local.record = None
+        wall = time.perf_counter() - started
+
+        match = request.resolver_match
+        view_name = match.view_name if match else '<unresolved>'
+        slow_queries = sorted(record.slow_queries, key=lambda query: -query['ms'])[:3]
+        for query in slow_queries:
+            query['path'] = request.path
+        registry.record(view_name, {
+            'wall_ms': wall * 1000,
+            'db_ms': record.db * 1000,
+            'template_ms': record.template * 1000,
+            'queries': record.queries,
+        }, slow_queries)
+        registry.maybe_flush()
+        return response
+
+
+class ReplicaMiddleware:
+    '''
+    Pins a session to the primary database for REPLICA_MAX_LAG seconds after
+    any of its requests writes, so the pages read from the replica show the
+    session its own writes. Only used when a replica is configured.
+    '''
+
+    def __init__(self, get_response):
+        if not routers.replica_configured():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = routers.RequestState(request.session)
+        token = routers.request_state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.request_state.reset(token)
+        # A request without a session has nothing to pin; pinning it would
+        # create a session row and cookie.
+        if state.wrote and not state.sessionless and request.session.session_key is not None:
+            request.session[routers.PINNED_KEY] = time.time() + settings.REPLICA_MAX_LAG
+        return response
+
+
+# Pre-compressed siblings written by collectstatic, best first.
+STATIC_ENCODINGS = (('.br', 'br'), ('.gz', 'gzip'))
+
+
+def accepted_encodings(header):
+    encodings = set()
+    for part in header.split(','):
+        encoding, *params = [item.strip() for item in part.split(';')]
+        quality = next((param[2:] for param in params if param.startswith('q=')), '1')
+        try:
+            if float(quality) > 0:
+                encodings.add(encoding.lower())
+        except ValueError:
+            pass
+    return encodings
+
+
+class StaticFilesMiddleware:
+    '''
+    Serves the collected static files (STATIC_ROOT) when settings.SERVE_STATIC
+    is true, for deployments with no web server or CDN in front of Django.
+    Files are sent pre-compressed (see institution.storage) when the client
+    accepts it. Files under content-hashed names are cached by the browser
+    for a year; the others for STATIC_MAX_AGE seconds.
+    '''
+
+    def __init__(self, get_response):
+        if not settings.SERVE_STATIC:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.hashed_names = set(getattr(staticfiles_storage, 'hashed_files', {}).values())
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(settings.STATIC_URL):
+            response = self.serve(request, request.path_info[len(settings.STATIC_URL):])
+            if response is not None:
+                return response
+        return self.get_response(request)
+
+    def serve(self, request, name):
+        try:
+            path = safe_join(settings.STATIC_ROOT, name)
+        except SuspiciousFileOperation:
+            return None
+        if not os.path.isfile(path):
+            return None
+
+        stat = os.stat(path)
+        if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime, stat.st_size):
+            response = HttpResponseNotModified()
+        else:
+            content_type, _ = mimetypes.guess_type(path)
+            accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            suffix, encoding = next((
+                (suffix, encoding) for suffix, encoding in STATIC_ENCODINGS
+                if encoding in accepted and os.path.isfile(path + suffix)
+            ), ('', None))
+            response = FileResponse(open(path + suffix, 'rb'), content_type=content_type or 'application/octet-stream')
+            if encoding:
+                response['Content-Encoding'] = encoding
+            response['Last-Modified'] = http_date(stat.st_mtime)
+        if name in self.hashed_names:
+            response['Cache-Control'] = 'public, max-age=31536000, immutable'
+        else:
+            response['Cache-Control'] = 'public, max-age=%d' % settings.STATIC_MAX_AGE
+        patch_vary_headers(response, ('Accept-Encoding', ))
+        return response
@@ -0,0 +1,44 @@
+# Generated by Django 3.1 on 2026-10-18 14:05
+
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+def create_tallies(apps, schema_editor):
+    Candidate = apps.get_model('institution', 'Candidate')
+    CandidateTally = apps.get_model('institution', 'CandidateTally')
+    StudentVote = apps.get_model('institution', 'StudentVote')
+    counts = dict(
+        StudentVote.objects.values('candidate').annotate(votes=Count('pk')).values_list('candidate', 'votes')
+    )
+    CandidateTally.objects.bulk_create([
+        CandidateTally(
+            election_id=candidate.position.election_id,
+            position_id=candidate.position_id,
+            candidate_id=candidate.pk,
+            count=counts.get(candidate.pk, 0),
+        )
+        for candidate in Candidate.objects.select_related('position')
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institution', '0008_auto_20210428_1242'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandidateTally',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('candidate', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='tally', to='institution.candidate')),
+                ('election', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='institution.election')),
+                ('position', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tallies', to='institution.position')),
+            ],
+        ),
+        migrations.RunPython(create_tallies, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 3.1 on 2026-10-18 14:08
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min
+
+
+def remove_duplicate_votes(apps, schema_editor):
+    # Double submits could save the same vote twice before the unique
+    # constraints existed. Keep the first row of each and take the extras
+    # back off the tallies.
+    CandidateTally = apps.get_model('institution', 'CandidateTally')
+    StudentVote = apps.get_model('institution', 'StudentVote')
+    VotedElection = apps.get_model('institution', 'VotedElection')
+
+    duplicates = StudentVote.objects.values('student', 'candidate') \
+        .annotate(first=Min('pk'), votes=Count('pk')) \
+        .filter(votes__gt=1)
+    for duplicate in duplicates:
+        StudentVote.objects.filter(student=duplicate['student'], candidate=duplicate['candidate']) \
+            .exclude(pk=duplicate['first']) \
+            .delete()
+        CandidateTally.objects.filter(candidate=duplicate['candidate']) \
+            .update(count=F('count') - (duplicate['votes'] - 1))
+
+    duplicates = VotedElection.objects.values('student', 'election') \
+        .annotate(first=Min('pk'), votes=Count('pk')) \
+        .filter(votes__gt=1)
+    for duplicate in duplicates:
+        VotedElection.objects.filter(student=duplicate['student'], election=duplicate['election']) \
+            .exclude(pk=duplicate['first']) \
+            .delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institution', '0009_candidatetally'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='position',
+            index=models.Index(fields=['election', 'text'], name='position_election_text'),
+        ),
+        migrations.AddIndex(
+            model_name='votedelection',
+            index=models.Index(fields=['election', '-date'], name='votedelection_election_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='studentvote',
+            constraint=models.UniqueConstraint(fields=('student', 'candidate'), name='unique_student_candidate'),
+        ),
+        migrations.AddConstraint(
+            model_name='votedelection',
+            constraint=models.UniqueConstraint(fields=('student', 'election'), name='unique_student_election'),
+        ),
+    ]
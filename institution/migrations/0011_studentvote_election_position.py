@@ -0,0 +1,79 @@
+# Generated by Django 3.1 on 2026-10-18 14:20
+
+from django.db import migrations, models
+from django.db.models import Count, F, Min, OuterRef, Subquery
+import django.db.models.deletion
+
+
+def copy_election_and_position(apps, schema_editor):
+    Candidate = apps.get_model('institution', 'Candidate')
+    StudentVote = apps.get_model('institution', 'StudentVote')
+    candidates = Candidate.objects.filter(pk=OuterRef('candidate_id'))
+    StudentVote.objects.update(
+        position_id=Subquery(candidates.values('position_id')),
+        election_id=Subquery(candidates.values('position__election_id')),
+    )
+
+
+def remove_second_votes(apps, schema_editor):
+    # Before (student, position) was unique a replayed wizard step could save
+    # a second, different candidate for a position. Only the first vote counts.
+    CandidateTally = apps.get_model('institution', 'CandidateTally')
+    StudentVote = apps.get_model('institution', 'StudentVote')
+    duplicates = StudentVote.objects.values('student', 'position') \
+        .annotate(first=Min('pk'), votes=Count('pk')) \
+        .filter(votes__gt=1)
+    for duplicate in duplicates:
+        extra_votes = StudentVote.objects.filter(student=duplicate['student'], position=duplicate['position']) \
+            .exclude(pk=duplicate['first'])
+        for candidate_id in extra_votes.values_list('candidate_id', flat=True):
+            CandidateTally.objects.filter(candidate=candidate_id).update(count=F('count') - 1)
+        extra_votes.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institution', '0010_vote_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='studentvote',
+            name='election',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='institution.election'),
+        ),
+        migrations.AddField(
+            model_name='studentvote',
+            name='position',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='institution.position'),
+        ),
+        migrations.RunPython(copy_election_and_position, migrations.RunPython.noop),
+        migrations.RunPython(remove_second_votes, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='studentvote',
+            name='election',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='institution.election'),
+        ),
+        migrations.AlterField(
+            model_name='studentvote',
+            name='position',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='institution.position'),
+        ),
+        migrations.RemoveConstraint(
+            model_name='studentvote',
+            name='unique_student_candidate',
+        ),
+        migrations.AddConstraint(
+            model_name='studentvote',
+            constraint=models.UniqueConstraint(fields=('student', 'position'), name='unique_student_position'),
+        ),
+        migrations.AddIndex(
+            model_name='studentvote',
+            index=models.Index(fields=['student', 'election', 'position'], name='studentvote_student_election'),
+        ),
+        migrations.AddIndex(
+            model_name='studentvote',
+            index=models.Index(fields=['election', 'candidate'], name='studentvote_election_candidate'),
+        ),
+    ]
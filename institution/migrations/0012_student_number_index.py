@@ -0,0 +1,18 @@
+# Generated by Django 3.1 on 2026-10-18 14:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institution', '0011_studentvote_election_position'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='student',
+            name='student_number',
+            field=models.CharField(db_index=True, max_length=20, null=True),
+        ),
+    ]
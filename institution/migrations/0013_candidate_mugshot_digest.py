@@ -0,0 +1,18 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institution', '0012_student_number_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='candidate',
+            name='mugshot_digest',
+            field=models.CharField(blank=True, default='', editable=False, max_length=20),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 3.1.14 on 2026-10-18 14:58
+
+from django.db import migrations, models
+from django.db.models import Count
+from django.db.models.functions import TruncMinute
+import django.db.models.deletion
+
+
+def count_turnout(apps, schema_editor):
+    TurnoutCount = apps.get_model('institution', 'TurnoutCount')
+    VotedElection = apps.get_model('institution', 'VotedElection')
+    totals = VotedElection.objects.values_list('election', TruncMinute('date')).annotate(voters=Count('pk'))
+    by_faculty = VotedElection.objects.filter(student__faculty__isnull=False) \
+        .values_list('election', 'student__faculty', TruncMinute('date')).annotate(voters=Count('pk'))
+    TurnoutCount.objects.bulk_create([
+        TurnoutCount(election_id=election_id, minute=minute, voters=voters)
+        for election_id, minute, voters in totals
+    ] + [
+        TurnoutCount(election_id=election_id, faculty_id=faculty_id, minute=minute, voters=voters)
+        for election_id, faculty_id, minute, voters in by_faculty
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institution', '0013_candidate_mugshot_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TurnoutCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('minute', models.DateTimeField()),
+                ('voters', models.PositiveIntegerField(default=0)),
+                ('election', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='turnout', to='institution.election')),
+                ('faculty', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='institution.faculty')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='turnoutcount',
+            constraint=models.UniqueConstraint(fields=('election', 'faculty', 'minute'), name='unique_turnout_faculty_minute'),
+        ),
+        migrations.AddConstraint(
+            model_name='turnoutcount',
+            constraint=models.UniqueConstraint(condition=models.Q(faculty=None), fields=('election', 'minute'), name='unique_turnout_minute'),
+        ),
+        migrations.RunPython(count_turnout, migrations.RunPython.noop),
+    ]
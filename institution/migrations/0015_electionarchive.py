@@ -0,0 +1,32 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institution', '0014_turnoutcount'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='election',
+            name='archived',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='ElectionArchive',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archived_at', models.DateTimeField()),
+                ('path', models.CharField(max_length=255)),
+                ('sha256', models.CharField(max_length=64)),
+                ('voters', models.PositiveIntegerField()),
+                ('votes', models.PositiveIntegerField()),
+                ('tallies', models.JSONField()),
+                ('election', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='archive', to='institution.election')),
+            ],
+        ),
+    ]
@@ -0,0 +1,88 @@
+# Generated by Django 3.1.14 on 2026-10-18 15:03
+
+import hashlib
+import hmac
+import json
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+# Copied from institution/ledger.py, so that changing the entry format there
+# can't change what this migration writes.
+GENESIS = '0' * 64
+
+
+def entry_hash(previous, election_id, sequence, student_id, votes, closed):
+    payload = json.dumps([election_id, sequence, student_id, votes, closed], separators=(',', ':'))
+    return hmac.new(settings.LEDGER_KEY.encode(), (previous + payload).encode(), hashlib.sha256).hexdigest()
+
+
+def ledger_existing_votes(apps, schema_editor):
+    # One entry per student who has voted, in the order they first voted.
+    Election = apps.get_model('institution', 'Election')
+    LedgerEntry = apps.get_model('institution', 'LedgerEntry')
+    StudentVote = apps.get_model('institution', 'StudentVote')
+    VotedElection = apps.get_model('institution', 'VotedElection')
+    for election_id in Election.objects.order_by('pk').values_list('pk', flat=True):
+        ballots = OrderedDict()
+        for student_id, position_id, candidate_id in StudentVote.objects.filter(election=election_id) \
+                .order_by('pk').values_list('student', 'position', 'candidate'):
+            ballots.setdefault(student_id, []).append([position_id, candidate_id])
+        closed = set(VotedElection.objects.filter(election=election_id).values_list('student', flat=True))
+        for student_id in sorted(closed - ballots.keys()):
+            ballots[student_id] = []
+        previous, entries = GENESIS, []
+        for sequence, (student_id, votes) in enumerate(ballots.items(), 1):
+            votes = sorted(votes)
+            previous = entry_hash(previous, election_id, sequence, student_id, votes, student_id in closed)
+            entries.append(LedgerEntry(election_id=election_id, sequence=sequence, student_id=student_id,
+                                       votes=votes, closed=student_id in closed, hash=previous))
+        LedgerEntry.objects.bulk_create(entries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('institution', '0015_electionarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LedgerEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('student_id', models.PositiveIntegerField()),
+                ('votes', models.JSONField()),
+                ('closed', models.BooleanField(default=False)),
+                ('hash', models.CharField(max_length=64)),
+                ('election', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='institution.election')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='LedgerCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sequence', models.PositiveIntegerField()),
+                ('hash', models.CharField(max_length=64)),
+                ('root', models.CharField(max_length=64)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('election', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='institution.election')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ledgerentry',
+            index=models.Index(fields=['election', 'student_id'], name='ledgerentry_election_student'),
+        ),
+        migrations.AddConstraint(
+            model_name='ledgerentry',
+            constraint=models.UniqueConstraint(fields=('election', 'sequence'), name='unique_ledger_sequence'),
+        ),
+        migrations.AddConstraint(
+            model_name='ledgercheckpoint',
+            constraint=models.UniqueConstraint(fields=('election', 'sequence'), name='unique_ledger_checkpoint'),
+        ),
+        migrations.RunPython(ledger_existing_votes, migrations.RunPython.noop),
+    ]
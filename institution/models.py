@@ -1,5 +1,8 @@
+from collections import Counter, defaultdict
+
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.db.models import F, Q
 from django.utils.html import escape, mark_safe
 
 
@@ -26,6 +29,9 @@ class Election(models.Model):
     owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='elections')
     name = models.CharField(max_length=255)
     faculty = models.ForeignKey(Faculty, on_delete=models.CASCADE, related_name='elections')
+    # Closed for voting, with its raw votes moved to an archive file
+    # (institution/archive.py).
+    archived = models.BooleanField(default=False)
 
     def __str__(self):
         return self.name
@@ -35,6 +41,11 @@ class Position(models.Model):
     election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='positions')
     text = models.CharField('Position', max_length=255)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['election', 'text'], name='position_election_text'),
+        ]
+
     def __str__(self):
         return self.text
 
@@ -42,6 +53,8 @@ class Position(models.Model):
 class Candidate(models.Model):
     position = models.ForeignKey(Position, on_delete=models.CASCADE, related_name='candidates')
     mugshot = models.ImageField(upload_to='candidates/', blank=True, null=True)
+    # Names the mugshot's thumbnails (institution/mugshots.py).
+    mugshot_digest = models.CharField(max_length=20, blank=True, default='', editable=False)
     full_name = models.CharField('Candidate full name', max_length=255)
 
     def __str__(self):
@@ -53,12 +66,15 @@ class Student(models.Model):
     elections = models.ManyToManyField(Election, through='VotedElection')
     faculty = models.ManyToManyField(Faculty, related_name='student_faculty')
     mobile = models.CharField(blank=False, max_length=20, null=True)
-    student_number = models.CharField(blank=False, max_length=20, null=True)
+    student_number = models.CharField(blank=False, max_length=20, null=True, db_index=True)
+
+    def get_voted_positions(self, election):
+        return self.election_candidate \
+            .filter(election=election) \
+            .values_list('position_id', flat=True)
 
     def get_unvoted_positions(self, election):
-        voted_positions = self.election_candidate \
-            .filter(candidate__position__election=election) \
-            .values_list('candidate__position__pk', flat=True)
+        voted_positions = self.get_voted_positions(election)
         positions = election.positions.exclude(pk__in=voted_positions).order_by('text')
         return positions
 
@@ -71,7 +87,183 @@ class VotedElection(models.Model):
     election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='voted_elections')
     date = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'election'], name='unique_student_election'),
+        ]
+        indexes = [
+            models.Index(fields=['election', '-date'], name='votedelection_election_date'),
+        ]
+
 
 class StudentVote(models.Model):
     student = models.ForeignKey(Student, on_delete=models.CASCADE, related_name='election_candidate')
     candidate = models.ForeignKey(Candidate, on_delete=models.CASCADE, related_name='+')
+    # Copied from the candidate so per-election questions don't have to join
+    # through Candidate and Position.
+    position = models.ForeignKey(Position, on_delete=models.CASCADE, related_name='+')
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='+')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['student', 'position'], name='unique_student_position'),
+        ]
+        indexes = [
+            models.Index(fields=['student', 'election', 'position'], name='studentvote_student_election'),
+            models.Index(fields=['election', 'candidate'], name='studentvote_election_candidate'),
+        ]
+
+    def save(self, *args, **kwargs):
+        if self.position_id is None:
+            self.position_id = self.candidate.position_id
+        if self.election_id is None:
+            self.election_id = self.candidate.position.election_id
+        super().save(*args, **kwargs)
+
+
+class CandidateTallyManager(models.Manager):
+    def increment(self, candidate_ids):
+        '''
+        Adds one vote to the running tally of every given candidate, once per
+        occurrence. Call it inside the transaction that saves the matching
+        StudentVote rows so the tally and the raw votes commit (or roll back)
+        together.
+        '''
+        votes = Counter(candidate_ids)
+        # One UPDATE per distinct vote count: a single ballot is one UPDATE.
+        by_count = defaultdict(list)
+        for candidate_id, count in votes.items():
+            by_count[count].append(candidate_id)
+        updated = sum(
+            self.filter(candidate__in=ids).update(count=F('count') + count)
+            for count, ids in by_count.items()
+        )
+        if updated < len(votes):
+            existing = set(self.filter(candidate__in=votes).values_list('candidate_id', flat=True))
+            missing = Candidate.objects.filter(pk__in=votes).exclude(pk__in=existing).select_related('position')
+            for candidate in missing:
+                tally, _ = self.get_or_create(candidate=candidate, defaults={
+                    'election_id': candidate.position.election_id,
+                    'position_id': candidate.position_id,
+                })
+                self.filter(pk=tally.pk).update(count=F('count') + votes[candidate.pk])
+
+
+class CandidateTally(models.Model):
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='tallies')
+    position = models.ForeignKey(Position, on_delete=models.CASCADE, related_name='tallies')
+    candidate = models.OneToOneField(Candidate, on_delete=models.CASCADE, related_name='tally')
+    count = models.PositiveIntegerField(default=0)
+
+    objects = CandidateTallyManager()
+
+    def __str__(self):
+        return '%s: %d' % (self.candidate, self.count)
+
+
+class TurnoutCountManager(models.Manager):
+    def increment(self, voted_elections):
+        '''
+        Counts each VotedElection in its minute: once in the election-wide
+        row and once under every faculty of the student. Call it inside the
+        transaction that saves them.
+        '''
+        voted_elections = list(voted_elections)
+        StudentFaculty = Student.faculty.through
+        faculties = defaultdict(list)
+        for student_id, faculty_id in StudentFaculty.objects \
+                .filter(student__in={voted.student_id for voted in voted_elections}) \
+                .values_list('student_id', 'faculty_id'):
+            faculties[student_id].append(faculty_id)
+
+        voters = Counter()
+        for voted in voted_elections:
+            minute = voted.date.replace(second=0, microsecond=0)
+            for faculty_id in [None] + faculties[voted.student_id]:
+                voters[voted.election_id, faculty_id, minute] += 1
+        for (election_id, faculty_id, minute), count in voters.items():
+            key = {'election_id': election_id, 'faculty_id': faculty_id, 'minute': minute}
+            if not self.filter(**key).update(voters=F('voters') + count):
+                turnout, created = self.get_or_create(**key, defaults={'voters': count})
+                if not created:
+                    self.filter(pk=turnout.pk).update(voters=F('voters') + count)
+
+
+class TurnoutCount(models.Model):
+    '''
+    Students who closed their ballot in one election in one minute, under
+    one of their faculties, or in total when faculty is null.
+    '''
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='turnout')
+    faculty = models.ForeignKey(Faculty, on_delete=models.CASCADE, related_name='+', null=True)
+    minute = models.DateTimeField()
+    voters = models.PositiveIntegerField(default=0)
+
+    objects = TurnoutCountManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['election', 'faculty', 'minute'], name='unique_turnout_faculty_minute'),
+            # NULLs never clash in a unique index, so the totals need their own.
+            models.UniqueConstraint(fields=['election', 'minute'], condition=Q(faculty=None),
+                                    name='unique_turnout_minute'),
+        ]
+
+
+class ElectionArchive(models.Model):
+    '''
+    What is left of an election's votes in the database once they have been
+    archived: the final tallies and counts, and the file holding the raw rows.
+    '''
+    election = models.OneToOneField(Election, on_delete=models.CASCADE, related_name='archive')
+    archived_at = models.DateTimeField()
+    path = models.CharField(max_length=255)
+    sha256 = models.CharField(max_length=64)
+    voters = models.PositiveIntegerField()
+    votes = models.PositiveIntegerField()
+    # [{'position', 'candidate', 'candidate_id', 'votes'}], as on the results page.
+    tallies = models.JSONField()
+
+    def __str__(self):
+        return '%s (archived %s)' % (self.election, self.archived_at)
+
+
+class LedgerEntry(models.Model):
+    '''
+    One committed write of a student's ballot: the votes it saved, or the
+    closing of the ballot. Entries of an election are numbered from 1 and
+    each hash covers the previous one (institution/ledger.py).
+    '''
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='+')
+    sequence = models.PositiveIntegerField()
+    # Not a foreign key: the ledger must outlive changes to the student rows.
+    student_id = models.PositiveIntegerField()
+    # [[position id, candidate id], ...], sorted.
+    votes = models.JSONField()
+    closed = models.BooleanField(default=False)
+    hash = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['election', 'sequence'], name='unique_ledger_sequence'),
+        ]
+        indexes = [
+            models.Index(fields=['election', 'student_id'], name='ledgerentry_election_student'),
+        ]
+
+
+class LedgerCheckpoint(models.Model):
+    '''
+    A verified prefix of an election's ledger: the hash of its last entry,
+    and the Merkle root of the entries since the previous checkpoint.
+    '''
+    election = models.ForeignKey(Election, on_delete=models.CASCADE, related_name='+')
+    sequence = models.PositiveIntegerField()
+    hash = models.CharField(max_length=64)
+    root = models.CharField(max_length=64)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['election', 'sequence'], name='unique_ledger_checkpoint'),
+        ]
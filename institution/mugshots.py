@@ -0,0 +1,90 @@
+'''
+Thumbnails of candidate mugshots.
+
+Mugshots are uploaded as they come off a phone, often several megabytes
+each, and the ballot shows them as small squares. So every mugshot is
+cropped to a square of MUGSHOT_SIZE pixels (and twice that, for high-density
+screens) and stored in WebP and JPEG next to the original, as
+candidates/thumbs/<digest>-<size>.<ext>. The digest is a hash of the
+original image and is kept on Candidate.mugshot_digest. A new image gets new
+names, so the thumbnails never change once written and can be cached
+forever.
+
+Thumbnails are rendered when a mugshot is uploaded (see signals.py). Run
+`manage.py render_mugshots` for mugshots uploaded before that.
+'''
+import hashlib
+from collections import namedtuple
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+DENSITIES = (1, 2)
+# (extension, Pillow format)
+FORMATS = (('webp', 'WEBP'), ('jpg', 'JPEG'))
+
+Thumbnails = namedtuple('Thumbnails', ['size', 'src', 'srcset', 'webp_srcset'])
+
+
+def thumbnail_name(digest, size, extension):
+    return 'candidates/thumbs/%s-%d.%s' % (digest, size, extension)
+
+
+def file_digest(f):
+    sha = hashlib.sha256()
+    for chunk in iter(lambda: f.read(64 * 1024), b''):
+        sha.update(chunk)
+    return sha.hexdigest()[:20]
+
+
+def render(f):
+    '''
+    Renders the thumbnails of the image in the open file `f` and returns its
+    digest. Thumbnails that already exist are not rendered again. Leaves `f`
+    at its start.
+    '''
+    f.seek(0)
+    digest = file_digest(f)
+    sizes = [settings.MUGSHOT_SIZE * density for density in DENSITIES]
+    missing = [
+        (size, extension, image_format) for size in sizes for extension, image_format in FORMATS
+        if not default_storage.exists(thumbnail_name(digest, size, extension))
+    ]
+    if missing:
+        f.seek(0)
+        image = Image.open(f)
+        # JPEGs decode straight to a fraction of their size, which is most of
+        # the work for a phone photo.
+        image.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        thumbnails = {}
+        for size, extension, image_format in missing:
+            if size not in thumbnails:
+                thumbnails[size] = ImageOps.fit(image, (size, size), Image.LANCZOS)
+            data = BytesIO()
+            thumbnails[size].save(data, image_format, quality=settings.MUGSHOT_QUALITY)
+            default_storage.save(thumbnail_name(digest, size, extension), ContentFile(data.getvalue()))
+    f.seek(0)
+    return digest
+
+
+def get_thumbnails(digest):
+    '''
+    URLs of the thumbnails with the given digest, for a <picture> element.
+    '''
+    if not digest:
+        return None
+
+    def srcset(extension):
+        return ', '.join('%s %dx' % (
+            default_storage.url(thumbnail_name(digest, settings.MUGSHOT_SIZE * density, extension)), density)
+            for density in DENSITIES)
+
+    return Thumbnails(
+        settings.MUGSHOT_SIZE,
+        default_storage.url(thumbnail_name(digest, settings.MUGSHOT_SIZE, 'jpg')),
+        srcset('jpg'),
+        srcset('webp'))
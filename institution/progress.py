@@ -0,0 +1,62 @@
+'''
+Cached record of how far each student got through each election's ballot.
+
+The vote page needs to know whether the student already voted in the
+election and which positions they still have to vote for. Both are read
+from a BallotProgress entry per (student, election) instead of the
+votedelection and studentvote tables. voting.py updates the entry as each
+vote commits, so only a student's first page of a ballot queries the
+database.
+
+A stale entry can't lead to a second vote: the database refuses a second
+vote for a position or a second close of an election, and the views then
+drop the entry and start over from the database. Votes deleted with a
+candidate or position the EC removed would leave the entry listing the
+position as voted, so entries are keyed on the election's ballot version,
+which every such change bumps.
+'''
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .ballot import get_ballot_version
+from .models import StudentVote, VotedElection
+
+BallotProgress = namedtuple('BallotProgress', ['voted_positions', 'closed'])
+
+
+def _key(student_id, election_id):
+    return 'progress:%d:%d:%d' % (student_id, election_id, get_ballot_version(election_id))
+
+
+def build_progress(student_id, election_id):
+    return BallotProgress(
+        frozenset(StudentVote.objects.filter(student=student_id, election=election_id)
+                  .values_list('position_id', flat=True)),
+        VotedElection.objects.filter(student=student_id, election=election_id).exists())
+
+
+def get_progress(student_id, election_id):
+    key = _key(student_id, election_id)
+    progress = cache.get(key)
+    if progress is None:
+        progress = build_progress(student_id, election_id)
+        cache.set(key, progress, settings.BALLOT_PROGRESS_CACHE_TIMEOUT)
+    return progress
+
+
+def record(student_id, election_id, position_ids=(), closed=False):
+    '''
+    Adds committed votes to the student's entry. A missing entry is left to
+    be built from the database.
+    '''
+    key = _key(student_id, election_id)
+    progress = cache.get(key)
+    if progress is not None:
+        cache.set(key, BallotProgress(progress.voted_positions | frozenset(position_ids), progress.closed or closed),
+                  settings.BALLOT_PROGRESS_CACHE_TIMEOUT)
+
+
+def invalidate_progress(student_id, election_id):
+    cache.delete(_key(student_id, election_id))
@@ -0,0 +1,135 @@
+'''
+Routing for a primary database plus a read replica (DATABASES['replica']).
+
+Writes always go to the primary. Reads go to the replica only inside
+read_from_replica views and replica_reads() blocks, i.e. the results and
+listing pages and the ballot snapshot, whose readers can live with a few
+seconds of replication lag. Everything else, including the checks that stop
+a student voting twice, reads from the primary.
+
+ReplicaMiddleware (institution.middleware) makes a session that wrote to the
+database read from the primary for the next REPLICA_MAX_LAG seconds, so a
+voter's completed list shows the vote they just cast.
+'''
+import asyncio
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.utils.functional import cached_property
+
+REPLICA = 'replica'
+PINNED_KEY = '_primary_until'
+
+# Set while a request is being served: a RequestState.
+request_state = ContextVar('request_state', default=None)
+_use_replica = ContextVar('use_replica', default=False)
+
+
+class RequestState:
+    def __init__(self, session):
+        self.session = session
+        self.wrote = False
+        # Set by views that must not read or write the session (voting
+        # tokens): they read from the primary if at all and are never pinned.
+        self.sessionless = False
+
+    @cached_property
+    def pinned(self):
+        # Read on first use, so requests that never reach the replica never
+        # load the session for it.
+        return self.sessionless or self.session.get(PINNED_KEY, 0) > time.time()
+
+
+def sessionless():
+    '''
+    Keeps the current request from reading or writing its session for
+    replica pinning.
+    '''
+    state = request_state.get()
+    if state is not None:
+        state.sessionless = True
+
+
+def replica_configured():
+    return REPLICA in settings.DATABASES
+
+
+def reading_from_replica():
+    return _use_replica.get() and replica_configured()
+
+
+@contextmanager
+def replica_reads():
+    '''
+    Sends the reads in the block to the replica, unless the session is
+    pinned to the primary.
+    '''
+    state = request_state.get()
+    token = _use_replica.set(state is None or not state.pinned)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def read_from_replica(view_func):
+    '''
+    View decorator for replica_reads(). Template responses are rendered
+    inside the block, since that's when their querysets run.
+    '''
+    if asyncio.iscoroutinefunction(view_func):
+        @wraps(view_func)
+        async def _wrapped_view(request, *args, **kwargs):
+            with replica_reads():
+                return await view_func(request, *args, **kwargs)
+        return _wrapped_view
+
+    @wraps(view_func)
+    def _wrapped_view(request, *args, **kwargs):
+        with replica_reads():
+            response = view_func(request, *args, **kwargs)
+            if hasattr(response, 'render') and callable(response.render) and not response.is_rendered:
+                response.render()
+        return response
+    return _wrapped_view
+
+
+def cache_timeout(timeout):
+    '''
+    The timeout for a cache entry built from the current reads. Entries
+    built from the replica may be stale, so they live at most
+    REPLICA_MAX_LAG seconds.
+    '''
+    if reading_from_replica():
+        return min(timeout, settings.REPLICA_MAX_LAG)
+    return timeout
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        # Sessions are written on every login; a lagging copy would log
+        # people out.
+        if reading_from_replica() and model._meta.app_label != 'sessions':
+            return REPLICA
+        # Not None: Django would otherwise follow an instance loaded from the
+        # replica back to it.
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = request_state.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary.
+        if db == REPLICA:
+            return False
+        return None
+
@@ -0,0 +1,122 @@
+import logging
+
+from django.conf import settings
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
+from PIL import Image
+
+from . import eligibility, mugshots, profiles
+from .ballot import invalidate_ballot
+from .models import Candidate, CandidateTally, Election, Position, Student, User, VotedElection
+
+logger = logging.getLogger(__name__)
+
+
+@receiver(connection_created)
+def configure_sqlite(sender, connection, **kwargs):
+    # settings.SQLITE_PRAGMAS, from the SQLITE_PROFILE in use.
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    with connection.cursor() as cursor:
+        for name, value in settings.SQLITE_PRAGMAS.items():
+            cursor.execute('PRAGMA %s = %s' % (name, value))
+
+
+@receiver(pre_save, sender=Candidate)
+def render_mugshot_thumbnails(sender, instance, **kwargs):
+    if not instance.mugshot:
+        instance.mugshot_digest = ''
+    # A fresh upload isn't in storage yet; stored mugshots keep their digest.
+    elif not instance.mugshot._committed:
+        try:
+            instance.mugshot_digest = mugshots.render(instance.mugshot.file)
+        except (OSError, Image.DecompressionBombError):
+            logger.exception('Could not render the thumbnails of %s', instance.mugshot.name)
+            instance.mugshot_digest = ''
+
+
+@receiver(post_save, sender=Candidate)
+def create_candidate_tally(sender, instance, created, **kwargs):
+    # Every candidate starts with a zero tally so that casting a vote is a
+    # single UPDATE and the results page lists candidates nobody voted for.
+    if created:
+        CandidateTally.objects.get_or_create(candidate=instance, defaults={
+            'election_id': instance.position.election_id,
+            'position_id': instance.position_id,
+        })
+
+
+# Cache invalidation runs on commit: a request that rebuilt a cache entry
+# between the signal and the commit would otherwise store the old data under
+# the new version.
+
+@receiver(post_save, sender=Position)
+@receiver(post_delete, sender=Position)
+def position_changed(sender, instance, **kwargs):
+    election_id = instance.election_id
+    transaction.on_commit(lambda: invalidate_ballot(election_id))
+    # The students' election list shows the number of positions.
+    faculty_id = Election.objects.filter(pk=election_id).values_list('faculty_id', flat=True).first()
+    if faculty_id is not None:
+        transaction.on_commit(lambda: eligibility.invalidate_faculty(faculty_id))
+
+
+@receiver(post_save, sender=Candidate)
+@receiver(post_delete, sender=Candidate)
+def candidate_changed(sender, instance, **kwargs):
+    # When a whole position is deleted its candidates go first and the
+    # position row may already be gone; the position's own signal covers it.
+    election_id = Position.objects.filter(pk=instance.position_id).values_list('election_id', flat=True).first()
+    if election_id is not None:
+        transaction.on_commit(lambda: invalidate_ballot(election_id))
+
+
+@receiver(pre_save, sender=Election)
+def remember_election_faculty(sender, instance, **kwargs):
+    instance._previous_faculty_id = Election.objects.filter(pk=instance.pk) \
+        .values_list('faculty_id', flat=True).first() if instance.pk else None
+
+
+@receiver(post_save, sender=Election)
+@receiver(post_delete, sender=Election)
+def election_changed(sender, instance, **kwargs):
+    # The cached election list rows are keyed on the ballot version.
+    election_id = instance.pk
+    transaction.on_commit(lambda: invalidate_ballot(election_id))
+    for faculty_id in {instance.faculty_id, getattr(instance, '_previous_faculty_id', None)} - {None}:
+        transaction.on_commit(lambda faculty_id=faculty_id: eligibility.invalidate_faculty(faculty_id))
+
+
+@receiver(post_save, sender=VotedElection)
+def election_voted(sender, instance, created, **kwargs):
+    if created:
+        student_id = instance.student_id
+        transaction.on_commit(lambda: eligibility.invalidate_student(student_id))
+
+
+@receiver(m2m_changed, sender=Student.faculty.through)
+def student_faculties_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        student_ids = [instance.pk]
+    elif pk_set is not None:
+        student_ids = pk_set
+    else:
+        # faculty.student_faculty.clear() doesn't say which students it touched.
+        student_ids = Student.objects.filter(faculty=instance).values_list('pk', flat=True)
+    for student_id in list(student_ids):
+        transaction.on_commit(lambda student_id=student_id: eligibility.invalidate_student(student_id))
+        transaction.on_commit(lambda student_id=student_id: profiles.invalidate_profile(student_id))
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+@receiver(post_save, sender=Student)
+@receiver(post_delete, sender=Student)
+def user_changed(sender, instance, **kwargs):
+    # Student shares its primary key with User.
+    user_id = instance.pk
+    transaction.on_commit(lambda: profiles.invalidate_profile(user_id))
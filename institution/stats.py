@@ -0,0 +1,206 @@
+'''
+In-memory, rolling per-view request statistics.
+
+RequestStatsMiddleware feeds one sample per request into the registry below.
+Samples land in one-minute slots, and only the last REQUEST_STATS_WINDOW
+minutes are kept, so memory is bounded no matter how long the process runs.
+Each process periodically writes its snapshot to REQUEST_STATS_DIR, where
+the dump_request_stats command and the EC stats page merge them.
+'''
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import defaultdict, deque
+
+from django.conf import settings
+
+# Upper bounds of the histogram buckets. Times are in milliseconds.
+TIME_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, float('inf'))
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, float('inf'))
+METRICS = {
+    'wall_ms': TIME_BUCKETS,
+    'db_ms': TIME_BUCKETS,
+    'template_ms': TIME_BUCKETS,
+    'queries': QUERY_BUCKETS,
+}
+MAX_SLOW_QUERIES = 20
+
+
+class Histogram:
+    def __init__(self, bounds, counts=None, total=0):
+        self.bounds = bounds
+        self.counts = counts or [0] * len(bounds)
+        self.total = total
+
+    def add(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += value
+
+    def merge(self, other):
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def percentile(self, pct):
+        '''
+        Upper bound of the bucket holding the pct-th percentile, or None if
+        it falls in the open-ended last bucket.
+        '''
+        target = self.count * pct / 100
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if count and seen >= target:
+                return bound if bound != float('inf') else None
+        return 0
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+class ViewStats:
+    def __init__(self):
+        self.histograms = {name: Histogram(bounds) for name, bounds in METRICS.items()}
+
+    def add(self, sample):
+        for name, histogram in self.histograms.items():
+            histogram.add(sample[name])
+
+    def merge(self, other):
+        for name, histogram in self.histograms.items():
+            histogram.merge(other.histograms[name])
+
+    def to_dict(self):
+        return {name: {'counts': h.counts, 'total': h.total} for name, h in self.histograms.items()}
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for name, values in data.items():
+            stats.histograms[name] = Histogram(METRICS[name], values['counts'], values['total'])
+        return stats
+
+
+class Registry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.slots = deque()
+        self.slow_queries = defaultdict(lambda: deque(maxlen=MAX_SLOW_QUERIES))
+        self.last_flush = time.monotonic()
+
+    def record(self, view_name, sample, slow_queries=()):
+        minute = int(time.time() // 60)
+        with self.lock:
+            if not self.slots or self.slots[-1][0] != minute:
+                self.slots.append((minute, defaultdict(ViewStats)))
+                while self.slots[0][0] <= minute - settings.REQUEST_STATS_WINDOW:
+                    self.slots.popleft()
+            self.slots[-1][1][view_name].add(sample)
+            self.slow_queries[view_name].extend(slow_queries)
+
+    def snapshot(self):
+        '''
+        The current window merged into one ViewStats per view, as plain data.
+        '''
+        oldest = int(time.time() // 60) - settings.REQUEST_STATS_WINDOW
+        merged = defaultdict(ViewStats)
+        with self.lock:
+            for minute, views in self.slots:
+                if minute > oldest:
+                    for view_name, stats in views.items():
+                        merged[view_name].merge(stats)
+            slow_queries = {name: list(queries) for name, queries in self.slow_queries.items()}
+        return {
+            'host': socket.gethostname(),
+            'pid': os.getpid(),
+            'time': time.time(),
+            'views': {name: stats.to_dict() for name, stats in merged.items()},
+            'slow_queries': slow_queries,
+        }
+
+    def maybe_flush(self):
+        now = time.monotonic()
+        # Claimed under the lock, so only one request thread flushes.
+        with self.lock:
+            if now - self.last_flush < settings.REQUEST_STATS_FLUSH_INTERVAL:
+                return
+            self.last_flush = now
+        self.flush()
+
+    def flush(self):
+        snapshot = self.snapshot()
+        os.makedirs(settings.REQUEST_STATS_DIR, exist_ok=True)
+        path = os.path.join(settings.REQUEST_STATS_DIR, '%s-%d.json' % (snapshot['host'], snapshot['pid']))
+        # A temporary file of its own, in case flush() is also called directly.
+        fd, tmp = tempfile.mkstemp(dir=settings.REQUEST_STATS_DIR, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+
+registry = Registry()
+
+
+def load_snapshots(max_age=None):
+    '''
+    Reads every process's last snapshot from REQUEST_STATS_DIR, skipping
+    those older than max_age seconds.
+    '''
+    snapshots = []
+    if not os.path.isdir(settings.REQUEST_STATS_DIR):
+        return snapshots
+    for name in sorted(os.listdir(settings.REQUEST_STATS_DIR)):
+        if not name.endswith('.json'):
+            continue
+        with open(os.path.join(settings.REQUEST_STATS_DIR, name)) as f:
+            snapshot = json.load(f)
+        if max_age is None or time.time() - snapshot['time'] <= max_age:
+            snapshots.append(snapshot)
+    return snapshots
+
+
+def merge_snapshots(snapshots):
+    views = defaultdict(ViewStats)
+    slow_queries = defaultdict(list)
+    for snapshot in snapshots:
+        for name, data in snapshot['views'].items():
+            views[name].merge(ViewStats.from_dict(data))
+        for name, queries in snapshot.get('slow_queries', {}).items():
+            slow_queries[name].extend(queries)
+    return views, slow_queries
+
+
+def summarize(views):
+    '''
+    One row per view: request count, wall-time percentiles and the mean of
+    every metric.
+    '''
+    rows = []
+    for name, stats in sorted(views.items()):
+        wall = stats.histograms['wall_ms']
+        rows.append({
+            'view': name,
+            'requests': wall.count,
+            'wall_p50_ms': wall.percentile(50),
+            'wall_p95_ms': wall.percentile(95),
+            'wall_p99_ms': wall.percentile(99),
+            'wall_mean_ms': round(wall.mean(), 2),
+            'db_mean_ms': round(stats.histograms['db_ms'].mean(), 2),
+            'template_mean_ms': round(stats.histograms['template_ms'].mean(), 2),
+            'queries_mean': round(stats.histograms['queries'].mean(), 2),
+            'queries_p95': stats.histograms['queries'].percentile(95),
+        })
+    return rows
@@ -0,0 +1,76 @@
+'''
+Static files storage for `manage.py collectstatic`.
+
+Files are collected under content-hashed names (css/app.3f2a9c1e.css) with a
+manifest mapping the names templates use to the hashed ones, so browsers can
+cache them for good and a changed file is fetched under its new name. Every
+compressible file also gets pre-built .gz and, when the brotli package is
+installed, .br siblings, so they're compressed once at deploy time rather
+than on every request. StaticFilesMiddleware (institution.middleware)
+serves them when no web server or CDN does.
+'''
+import gzip
+import logging
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.js', '.svg', '.html', '.txt', '.json', '.map', '.ttf', '.eot', '.ico')
+# Compressed siblings that don't save at least this fraction are not kept.
+MIN_SAVING = 0.05
+
+# (suffix, compress)
+COMPRESSORS = [('.gz', lambda data: gzip.compress(data, 9, mtime=0))]
+if brotli is not None:
+    COMPRESSORS.append(('.br', lambda data: brotli.compress(data, quality=11)))
+
+
+def compress(path):
+    '''
+    Writes path.gz and path.br next to `path` unless they are up to date or
+    not worth it.
+    '''
+    mtime = os.path.getmtime(path)
+    data = None
+    for suffix, compressor in COMPRESSORS:
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= mtime:
+            continue
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        compressed = compressor(data)
+        if len(compressed) <= len(data) * (1 - MIN_SAVING):
+            with open(target, 'wb') as f:
+                f.write(compressed)
+        elif os.path.exists(target):
+            os.remove(target)
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+        if dry_run:
+            return
+        if brotli is None:
+            logger.warning('The brotli package is not installed; only .gz static files were written.')
+        names = set(paths) | set(self.hashed_files.values())
+        for name in sorted(names):
+            if name.endswith(COMPRESSIBLE_EXTENSIONS) and self.exists(name):
+                compress(self.path(name))
+
+    def stored_name(self, name):
+        # A template referring to a file that was never collected gets the
+        # plain URL (which 404s) instead of failing to render. That covers
+        # running without collectstatic, e.g. the benchmarks.
+        try:
+            return super().stored_name(name)
+        except ValueError:
+            return name
@@ -0,0 +1,388 @@
+import datetime
+import io
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import journal, ledger, tokens
+from .archive import archive_election, restore_election
+from .ballot import get_ballot
+from .models import (Candidate, CandidateTally, Election, Faculty, LedgerEntry, Position, Student, StudentVote,
+                     TurnoutCount, User, VotedElection)
+from .progress import get_progress
+from .turnout import get_turnout
+from .voting import ElectionClosed, cast_ballot, record_votes
+
+
+class ElectionMixin:
+    def setUp(self):
+        # The eligibility, ballot and progress caches are keyed by ids, which
+        # the rolled back test transactions hand out again.
+        caches['default'].clear()
+        self.faculty = Faculty.objects.create(name='Testing')
+        self.officer = User.objects.create_user('officer', is_ec_officer=True)
+        self.election = self.create_election('Guild')
+        self.students = [self.create_student(i) for i in range(3)]
+
+    def create_election(self, name):
+        election = Election.objects.create(owner=self.officer, name=name, faculty=self.faculty)
+        for text in ('President', 'Treasurer'):
+            position = Position.objects.create(election=election, text=text)
+            for full_name in ('Alice', 'Bob'):
+                Candidate.objects.create(position=position, full_name='%s %s' % (full_name, text))
+        return election
+
+    def create_student(self, i):
+        student = Student.objects.create(user=User.objects.create_user('student%d' % i, is_student=True),
+                                         student_number='S%d' % i)
+        student.faculty.add(self.faculty)
+        return student
+
+    def ballot(self, election, choice=0):
+        return [position.candidates.order_by('pk')[choice] for position in election.positions.order_by('pk')]
+
+    def tallies(self, election):
+        return sorted(CandidateTally.objects.filter(election=election).values_list('candidate', 'count'))
+
+
+class ElectionTestCase(ElectionMixin, TestCase):
+    pass
+
+
+class TallyTests(ElectionTestCase):
+    def counts(self):
+        return dict(CandidateTally.objects.filter(election=self.election).values_list('candidate', 'count'))
+
+    def test_ballots_update_tallies(self):
+        cast_ballot(self.students[0], self.election, self.ballot(self.election, 0))
+        cast_ballot(self.students[1], self.election, self.ballot(self.election, 0))
+        cast_ballot(self.students[2], self.election, self.ballot(self.election, 1))
+        expected = {candidate.pk: 2 for candidate in self.ballot(self.election, 0)}
+        expected.update({candidate.pk: 1 for candidate in self.ballot(self.election, 1)})
+        self.assertEqual(self.counts(), expected)
+
+    def test_repeated_candidates(self):
+        first, second = self.ballot(self.election)
+        CandidateTally.objects.increment([first.pk, second.pk, first.pk, first.pk])
+        counts = self.counts()
+        self.assertEqual((counts[first.pk], counts[second.pk]), (3, 1))
+
+    def test_missing_tally_rows(self):
+        first, second = self.ballot(self.election)
+        CandidateTally.objects.filter(candidate=first).delete()
+        CandidateTally.objects.increment([first.pk, first.pk, second.pk])
+        tally = CandidateTally.objects.get(candidate=first)
+        self.assertEqual((tally.election_id, tally.position_id, tally.count),
+                         (self.election.pk, first.position_id, 2))
+        self.assertEqual(self.counts()[second.pk], 1)
+
+    def test_rebuild_tallies_corrects_drift(self):
+        for choice, student in enumerate(self.students[:2]):
+            cast_ballot(student, self.election, self.ballot(self.election, choice))
+        counts = self.counts()
+        first, second = self.ballot(self.election)
+        CandidateTally.objects.filter(candidate=first).update(count=7)
+        CandidateTally.objects.filter(candidate=second).delete()
+        TurnoutCount.objects.filter(election=self.election).delete()
+
+        call_command('rebuild_tallies', '--dry-run', stdout=io.StringIO())
+        self.assertEqual(self.counts()[first.pk], 7)
+        self.assertNotIn(second.pk, self.counts())
+
+        call_command('rebuild_tallies', '--election', str(self.election.pk), stdout=io.StringIO())
+        self.assertEqual(self.counts(), counts)
+        self.assertEqual(sum(TurnoutCount.objects.filter(election=self.election, faculty=None)
+                             .values_list('voters', flat=True)), 2)
+
+
+@override_settings(VOTING_TOKENS=True)
+class TokenTests(ElectionTestCase):
+    def url(self, student, election):
+        return reverse('students:token_vote', args=[tokens.make_token(student.pk, election.pk)])
+
+    def test_forged_tokens(self):
+        url = self.url(self.students[0], self.election)
+        student_id = str(self.students[0].pk)
+        tampered = url.replace('/%s.' % student_id, '/%s.' % self.students[1].pk)
+        self.assertNotEqual(tampered, url)
+        for bad in (tampered, reverse('students:token_vote', args=['%s.%d' % (student_id, self.election.pk)]),
+                    reverse('students:token_vote', args=['garbage'])):
+            self.assertEqual(self.client.get(bad).status_code, 404)
+
+    @override_settings(VOTING_TOKENS=False)
+    def test_tokens_turned_off(self):
+        self.assertEqual(self.client.get(self.url(self.students[0], self.election)).status_code, 404)
+
+    def test_closed_ballot(self):
+        cast_ballot(self.students[0], self.election, self.ballot(self.election))
+        response = self.client.get(self.url(self.students[0], self.election))
+        self.assertTemplateUsed(response, 'institution/students/token_voted.html')
+        self.assertTrue(response.context['voted'])
+
+    def test_archived_election(self):
+        Election.objects.filter(pk=self.election.pk).update(archived=True)
+        response = self.client.get(self.url(self.students[0], self.election))
+        self.assertTemplateUsed(response, 'institution/students/token_voted.html')
+        self.assertFalse(response.context['voted'])
+
+    def test_no_session_or_user_queries(self):
+        # A login session in the same browser must not be read either.
+        self.client.force_login(self.officer)
+        student, url = self.students[0], self.url(self.students[0], self.election)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get(url).status_code, 200)
+            self.client.post(url, {'position_%d' % candidate.position_id: candidate.pk
+                                   for candidate in self.ballot(self.election)})
+        self.assertTrue(VotedElection.objects.filter(student=student, election=self.election).exists())
+        tables = [query['sql'] for query in queries.captured_queries
+                  if 'django_session' in query['sql'] or 'institution_user' in query['sql']]
+        self.assertEqual(tables, [])
+
+
+class TurnoutTests(ElectionTestCase):
+    def setUp(self):
+        super().setUp()
+        self.other = Faculty.objects.create(name='Other')
+        self.students[0].faculty.add(self.other)
+        self.students[2].faculty.clear()
+        self.start = datetime.datetime(2026, 3, 2, 9, 0, tzinfo=timezone.utc)
+
+    def close(self, student, seconds):
+        # Unsaved: increment() only reads the student, election and date.
+        return VotedElection(student=student, election=self.election,
+                             date=self.start + datetime.timedelta(seconds=seconds))
+
+    def counts(self):
+        return sorted(TurnoutCount.objects.filter(election=self.election)
+                      .values_list('faculty', 'minute', 'voters'), key=lambda row: (row[0] or 0, row[1]))
+
+    def minute(self, minutes):
+        return self.start + datetime.timedelta(minutes=minutes)
+
+    def test_increment_by_faculty_and_minute(self):
+        TurnoutCount.objects.increment([self.close(self.students[0], 5), self.close(self.students[1], 50)])
+        TurnoutCount.objects.increment([self.close(self.students[2], 30), self.close(self.students[1], 61)])
+        self.assertEqual(self.counts(), [
+            (None, self.minute(0), 3),
+            (None, self.minute(1), 1),
+            (self.faculty.pk, self.minute(0), 2),
+            (self.faculty.pk, self.minute(1), 1),
+            (self.other.pk, self.minute(0), 1),
+        ])
+
+    def test_get_turnout(self):
+        TurnoutCount.objects.increment([
+            self.close(self.students[0], 5), self.close(self.students[1], 65), self.close(self.students[2], 3700)])
+        turnout = get_turnout(self.election, 'minute')
+        # The totals count the student without a faculty, who isn't eligible.
+        self.assertEqual((turnout['voters'], turnout['eligible']), (3, 2))
+        self.assertEqual(turnout['faculties'], [
+            {'id': self.other.pk, 'name': 'Other', 'voters': 1},
+            {'id': self.faculty.pk, 'name': 'Testing', 'voters': 2},
+        ])
+        self.assertEqual([(bucket['start'], bucket['voters'], bucket['cumulative']) for bucket in turnout['buckets']],
+                         [(self.minute(0), 1, 1), (self.minute(1), 1, 2), (self.minute(61), 1, 3)])
+        self.assertEqual([(bucket['start'], bucket['voters']) for bucket in get_turnout(self.election)['buckets']],
+                         [(self.minute(0), 2), (self.minute(60), 1)])
+
+    def test_turnout_json(self):
+        TurnoutCount.objects.increment([self.close(self.students[0], 5)])
+        self.client.force_login(self.officer)
+        url = reverse('ec:election_turnout', args=[self.election.pk])
+        response = self.client.get(url, {'bucket': 'minute'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.json()['voters'], response.json()['bucket']), (1, 'minute'))
+        self.assertEqual(self.client.get(url).json()['bucket'], 'hour')
+        self.assertEqual(self.client.get(url, {'bucket': 'day'}).status_code, 404)
+
+
+class BallotTests(ElectionTestCase):
+    def test_replica_snapshot_is_kept_apart(self):
+        with mock.patch('institution.ballot.reading_from_replica', return_value=True):
+            self.assertEqual(len(self.candidates()), 4)
+        # Removed on the primary, and not yet on the replica.
+        removed = self.ballot(self.election)[0].pk
+        Candidate.objects.filter(pk=removed).delete()
+        self.assertNotIn(removed, self.candidates())
+
+    def candidates(self):
+        return {candidate.pk for position in get_ballot(self.election.pk).positions
+                for candidate in position.candidates}
+
+
+class ProgressTests(ElectionMixin, TransactionTestCase):
+    # Caches are invalidated on commit, which TestCase never does.
+
+    def test_deleted_votes_leave_progress(self):
+        student, (candidate, _) = self.students[0], self.ballot(self.election)
+        with transaction.atomic():
+            record_votes(student, self.election, [candidate])
+        self.assertEqual(get_progress(student.pk, self.election.pk).voted_positions, {candidate.position_id})
+        candidate.delete()
+        self.assertEqual(get_progress(student.pk, self.election.pk).voted_positions, set())
+
+
+class JournalTests(ElectionTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(VOTE_INGESTION='journal', VOTE_JOURNAL_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def append(self, student, election, choice=0):
+        return journal.append(student.pk, election.pk, [candidate.pk for candidate in self.ballot(election, choice)])
+
+    def drain(self):
+        with journal.writer_lock(block=True):
+            return journal.drain()
+
+    def test_drain_saves_ballots(self):
+        for student in self.students:
+            self.append(student, self.election)
+        self.assertEqual(self.drain(), 3)
+        self.assertEqual(VotedElection.objects.filter(election=self.election).count(), 3)
+        self.assertEqual(StudentVote.objects.filter(election=self.election).count(), 6)
+        self.assertEqual(journal.backlog(), [])
+        self.assertEqual(self.drain(), 0)
+
+    def test_pending_until_drained(self):
+        self.append(self.students[0], self.election)
+        self.assertTrue(journal.is_pending(self.students[0].pk, self.election.pk))
+        self.assertFalse(journal.is_pending(self.students[1].pk, self.election.pk))
+        self.drain()
+        self.assertFalse(journal.is_pending(self.students[0].pk, self.election.pk))
+
+    def test_drain_skips_duplicates(self):
+        self.append(self.students[0], self.election, 0)
+        self.append(self.students[0], self.election, 1)
+        cast_ballot(self.students[1], self.election, self.ballot(self.election, 1))
+        self.append(self.students[1], self.election, 0)
+        self.drain()
+        saved = set(StudentVote.objects.filter(election=self.election).values_list('student', 'candidate'))
+        self.assertEqual(saved, {(student.pk, candidate.pk) for student, choice in ((self.students[0], 0),
+                                                                                   (self.students[1], 1))
+                                 for candidate in self.ballot(self.election, choice)})
+        self.assertEqual(VotedElection.objects.filter(election=self.election).count(), 2)
+
+    def test_fallback_saves_valid_ballots_only(self):
+        archived = self.create_election('Archived')
+        Election.objects.filter(pk=archived.pk).update(archived=True)
+        cast_ballot(self.students[0], self.election, self.ballot(self.election))
+        self.append(self.students[0], self.election)
+        self.append(self.students[1], self.election)
+        self.append(self.students[2], archived)
+        # As when a vote saved outside the journal commits mid-batch.
+        with mock.patch.object(journal, 'save_batch', side_effect=IntegrityError):
+            self.drain()
+        self.assertEqual(set(VotedElection.objects.filter(election=self.election).values_list('student', flat=True)),
+                         {self.students[0].pk, self.students[1].pk})
+        self.assertFalse(VotedElection.objects.filter(election=archived).exists())
+        self.assertFalse(StudentVote.objects.filter(election=archived).exists())
+
+
+class LedgerTests(ElectionTestCase):
+    def setUp(self):
+        super().setUp()
+        for student in self.students[:2]:
+            cast_ballot(student, self.election, self.ballot(self.election))
+
+    def verify(self, *args):
+        call_command('verify_ledger', '--election', str(self.election.pk), *args,
+                     stdout=io.StringIO(), stderr=io.StringIO())
+
+    def test_incremental_verify(self):
+        self.verify()
+        cast_ballot(self.students[2], self.election, self.ballot(self.election))
+        self.assertEqual(ledger.verify(self.election), (1, []))
+        self.assertEqual(ledger.verify(self.election, full=True), (3, []))
+
+    def test_edited_vote(self):
+        self.verify()
+        vote = StudentVote.objects.filter(election=self.election).first()
+        other = Candidate.objects.filter(position=vote.position_id).exclude(pk=vote.candidate_id).get()
+        StudentVote.objects.filter(pk=vote.pk).update(candidate=other)
+        with self.assertRaises(CommandError):
+            self.verify('--full')
+
+    def test_edited_vote_and_entry(self):
+        vote = StudentVote.objects.filter(election=self.election, student=self.students[0]).first()
+        other = Candidate.objects.filter(position=vote.position_id).exclude(pk=vote.candidate_id).get()
+        StudentVote.objects.filter(pk=vote.pk).update(candidate=other)
+        # Rewrite the chain to match, without the ledger key.
+        previous = ledger.GENESIS
+        with override_settings(LEDGER_KEY='guessed'):
+            for entry in LedgerEntry.objects.filter(election=self.election).order_by('sequence'):
+                if entry.student_id == vote.student_id:
+                    entry.votes = [[position_id, other.pk if candidate_id == vote.candidate_id else candidate_id]
+                                   for position_id, candidate_id in entry.votes]
+                entry.hash = previous = ledger.entry_hash(previous, self.election.pk, entry.sequence,
+                                                          entry.student_id, entry.votes, entry.closed)
+                entry.save()
+        with self.assertRaises(CommandError):
+            self.verify()
+
+    def test_edited_entry(self):
+        self.verify()
+        LedgerEntry.objects.filter(election=self.election, sequence=1).update(closed=False)
+        with self.assertRaises(CommandError):
+            self.verify('--full')
+
+    def test_removed_entry(self):
+        self.verify()
+        LedgerEntry.objects.filter(election=self.election, sequence=2).delete()
+        with self.assertRaises(CommandError):
+            self.verify()
+
+
+class ArchiveTests(ElectionTestCase):
+    def setUp(self):
+        super().setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(ELECTION_ARCHIVE_DIR=directory)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        for choice, student in enumerate(self.students[:2]):
+            cast_ballot(student, self.election, self.ballot(self.election, choice))
+
+    def test_archive_and_restore(self):
+        dates = sorted(VotedElection.objects.filter(election=self.election).values_list('student', 'date'))
+        archive = archive_election(self.election)
+        self.assertEqual((archive.voters, archive.votes), (2, 4))
+        self.assertFalse(StudentVote.objects.filter(election=self.election).exists())
+        call_command('verify_ledger', '--election', str(self.election.pk), '--full', stdout=io.StringIO())
+
+        self.assertEqual(restore_election(archive), (2, 4))
+        self.assertEqual(sorted(VotedElection.objects.filter(election=self.election).values_list('student', 'date')),
+                         dates)
+        call_command('verify_ledger', '--election', str(self.election.pk), '--full', stdout=io.StringIO())
+
+    def test_votes_refused_once_archived(self):
+        # The voter's view read the election before it was archived.
+        Election.objects.filter(pk=self.election.pk).update(archived=True)
+        with self.assertRaises(ElectionClosed):
+            cast_ballot(self.students[2], self.election, self.ballot(self.election))
+        self.assertFalse(StudentVote.objects.filter(student=self.students[2]).exists())
+        self.assertFalse(VotedElection.objects.filter(student=self.students[2]).exists())
+
+    def test_rebuild_tallies_keeps_archived_results(self):
+        archive_election(self.election)
+        tallies = self.tallies(self.election)
+        turnout = TurnoutCount.objects.filter(election=self.election).count()
+        self.assertEqual(sum(count for _, count in tallies), 4)
+        CandidateTally.objects.filter(election=self.election).update(count=0)
+
+        call_command('rebuild_tallies', stdout=io.StringIO())
+        self.assertEqual(self.tallies(self.election), tallies)
+        self.assertEqual(TurnoutCount.objects.filter(election=self.election).count(), turnout)
@@ -0,0 +1,35 @@
+'''
+Voting tokens: a signed (student, election) pair that lets a student open
+and cast their ballot for one election without logging in
+(settings.VOTING_TOKENS).
+
+A token is "<student id>.<election id>:<HMAC-SHA256 signature>". It is
+checked against SECRET_KEY and VOTING_TOKEN_SALT alone, so the ballot path
+never reads or writes the session and user tables. Because tokens are
+stateless, one can't be withdrawn on its own. Changing VOTING_TOKEN_SALT
+revokes all of them. Once the student's ballot is closed, the token only
+shows that they have voted.
+
+The EC mints tokens only for students of the election's faculty
+(`manage.py mint_voting_tokens`), so a valid token is proof of eligibility.
+'''
+from django.conf import settings
+from django.core import signing
+
+
+def get_signer():
+    return signing.Signer(salt=settings.VOTING_TOKEN_SALT, algorithm='sha256')
+
+
+def make_token(student_id, election_id):
+    return get_signer().sign('%d.%d' % (student_id, election_id))
+
+
+def check_token(token):
+    '''
+    Returns the (student id, election id) the token was minted for. Raises
+    signing.BadSignature if it wasn't minted with the current salt.
+    '''
+    value = get_signer().unsign(token)
+    student_id, election_id = value.split('.')
+    return int(student_id), int(election_id)
@@ -1,23 +1,38 @@
+from django.conf import settings
 from django.urls import include, path
 
-from .views import institution, students, ec
+from .views import institution, students, students_async, ec
+
+if settings.ASYNC_STUDENT_VIEWS:
+    election_list = students_async.election_list
+    voted_elections_list = students_async.voted_elections_list
+    vote = students_async.vote
+else:
+    election_list = students.ElectionListView.as_view()
+    voted_elections_list = students.VotedElectionListView.as_view()
+    vote = students.vote
 
 urlpatterns = [
     path('', institution.home, name='home'),
 
     path('students/', include(([
-        path('', students.ElectionListView.as_view(), name='election_list'),
+        path('', election_list, name='election_list'),
         path('faculty/', students.StudentFacultyView.as_view(), name='student_faculty'),
-        path('taken/', students.VotedElectionListView.as_view(), name='voted_elections_list'),
-        path('election/<int:pk>/', students.vote, name='vote'),
+        path('taken/', voted_elections_list, name='voted_elections_list'),
+        path('election/<int:pk>/', vote, name='vote'),
+        path('ballot/<str:token>/', students.token_vote, name='token_vote'),
     ], 'institution'), namespace='students')),
 
     path('ec/', include(([
         path('', ec.ElectionsListView.as_view(), name='election_change_list'),
+        path('stats/', ec.request_stats, name='request_stats'),
         path('election/add/', ec.ElectionsCreateView.as_view(), name='election_add'),
         path('election/<int:pk>/', ec.ElectionUpdateView.as_view(), name='election_change'),
         path('election/<int:pk>/delete/', ec.ElectionDeleteView.as_view(), name='election_delete'),
         path('election/<int:pk>/results/', ec.ElectionResultsView.as_view(), name='election_results'),
+        path('election/<int:pk>/results/live/', ec.election_results_live, name='election_results_live'),
+        path('election/<int:pk>/results/turnout.json', ec.election_turnout, name='election_turnout'),
+        path('election/<int:pk>/results/<slug:dataset>.<slug:export_format>', ec.election_export, name='election_export'),
         path('election/<int:pk>/position/add/', ec.position_add, name='position_add'),
         path('election/<int:election_pk>/position/<int:position_pk>/', ec.position_change, name='position_change'),
         path('election/<int:election_pk>/position/<int:position_pk>/delete/', ec.PositionDeleteView.as_view(), name='position_delete'),
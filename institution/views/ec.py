@@ -1,18 +1,28 @@
+import json
+import queue
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.db import transaction
 from django.db.models import Avg, Count
+from django.core.paginator import Paginator
 from django.forms import inlineformset_factory
+from django.http import Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.generic import (CreateView, DeleteView, DetailView, ListView,
                                   UpdateView)
 
+from .. import stats, turnout
 from ..decorators import ec_official_required
+from ..exports import export_response
+from ..live import publisher
 from ..forms import BaseCandidateInlineFormSet, PositionForm, ECOfficerSignUpForm
 from ..models import Candidate, Position, Election, User
+from ..routers import read_from_replica
 
 
 class ECOfficerSignUpView(CreateView):
@@ -30,7 +40,7 @@ class ECOfficerSignUpView(CreateView):
         return redirect('ec:election_change_list')
 
 
-@method_decorator([login_required, ec_official_required], name='dispatch')
+@method_decorator([login_required, ec_official_required, read_from_replica], name='dispatch')
 class ElectionsListView(ListView):
     model = Election
     ordering = ('name', )
@@ -98,19 +108,28 @@ class ElectionDeleteView(DeleteView):
         return self.request.user.elections.all()
 
 
-@method_decorator([login_required, ec_official_required], name='dispatch')
+@method_decorator([login_required, ec_official_required, read_from_replica], name='dispatch')
 class ElectionResultsView(DetailView):
     model = Election
     context_object_name = 'election'
     template_name = 'institution/ec/election_results.html'
+    paginate_voters_by = 50
 
     def get_context_data(self, **kwargs):
         election = self.get_object()
         voted_elections = election.voted_elections.select_related('student__user').order_by('-date')
-        total_voters = voted_elections.count()
+        paginator = Paginator(voted_elections, self.paginate_voters_by)
+        page = paginator.get_page(self.request.GET.get('page'))
+        total_voters = paginator.count
+        archive = getattr(election, 'archive', None) if election.archived else None
+        tallies = election.tallies.select_related('position', 'candidate').order_by('position__text', 'position', '-count', 'candidate__full_name')
         extra_context = {
-            'voted_elections': voted_elections,
+            'tallies': tallies,
+            'voted_elections': page,
+            'page_obj': page,
             'total_voters': total_voters,
+            'turnout': turnout.get_turnout(election),
+            'archive': archive,
         }
         kwargs.update(extra_context)
         return super().get_context_data(**kwargs)
@@ -119,6 +138,75 @@ class ElectionResultsView(DetailView):
         return self.request.user.elections.all()
 
 
+@login_required
+@ec_official_required
+def election_export(request, pk, dataset, export_format):
+    election = get_object_or_404(Election, pk=pk, owner=request.user)
+    return export_response(election, dataset, export_format)
+
+
+@login_required
+@ec_official_required
+@read_from_replica
+def election_turnout(request, pk):
+    '''
+    The election's turnout as JSON, by faculty and per ?bucket=hour (the
+    default) or minute.
+    '''
+    election = get_object_or_404(Election, pk=pk, owner=request.user)
+    bucket = request.GET.get('bucket', 'hour')
+    if bucket not in turnout.BUCKETS:
+        raise Http404('Unknown turnout bucket.')
+    return JsonResponse(turnout.get_turnout(election, bucket))
+
+
+@login_required
+@ec_official_required
+def election_results_live(request, pk):
+    '''
+    Server-sent events with the election's tallies and turnout: the full
+    state first, then the changed counts as votes commit.
+    '''
+    election = get_object_or_404(Election, pk=pk, owner=request.user)
+
+    def events():
+        subscription, state = publisher.subscribe(election.pk)
+        try:
+            yield 'event: state\ndata: %s\n\n' % json.dumps(state)
+            while True:
+                try:
+                    event = subscription.get(timeout=settings.LIVE_RESULTS_HEARTBEAT)
+                except queue.Empty:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield 'event: update\ndata: %s\n\n' % json.dumps(event)
+        finally:
+            publisher.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@ec_official_required
+def request_stats(request):
+    # Other processes' flushed snapshots plus this process's live numbers.
+    own = stats.registry.snapshot()
+    snapshots = [
+        snapshot for snapshot in stats.load_snapshots(max_age=settings.REQUEST_STATS_WINDOW * 60)
+        if (snapshot['host'], snapshot['pid']) != (own['host'], own['pid'])
+    ]
+    views, slow_queries = stats.merge_snapshots(snapshots + [own])
+    return JsonResponse({
+        'processes': len(snapshots) + 1,
+        'window_minutes': settings.REQUEST_STATS_WINDOW,
+        'views': stats.summarize(views),
+        'slow_queries': slow_queries,
+    })
+
+
 @login_required
 @ec_official_required
 def position_add(request, pk):
@@ -167,7 +255,7 @@ def position_change(request, election_pk, position_pk):
 
     if request.method == 'POST':
         form = PositionForm(request.POST, instance=position)
-        formset = CandidateFormSet(request.POST, instance=position)
+        formset = CandidateFormSet(request.POST, request.FILES, instance=position)
         if form.is_valid() and formset.is_valid():
             with transaction.atomic():
                 form.save()
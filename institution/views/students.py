@@ -1,16 +1,33 @@
+from collections import namedtuple
+from contextlib import nullcontext
+
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import login
+from django.contrib.auth.models import AnonymousUser
 from django.contrib.auth.decorators import login_required
-from django.db import transaction
-from django.db.models import Count
+from django.db import IntegrityError, transaction
+from django.core import signing
+from django.http import Http404
 from django.shortcuts import get_object_or_404, redirect, render
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.utils.decorators import method_decorator
 from django.views.generic import CreateView, ListView, UpdateView
 
+from .. import journal, tokens
 from ..decorators import student_required
-from ..forms import StudentFacultyForm, StudentSignUpForm, VoteForm
+from ..forms import BallotForm, StudentFacultyForm, StudentSignUpForm, VoteForm
+from ..ballot import get_ballot, get_ballot_versions
+from ..eligibility import get_open_elections
 from ..models import Election, Student, VotedElection, User
+from ..progress import get_progress, invalidate_progress
+from ..routers import cache_timeout, read_from_replica, replica_reads, sessionless
+from ..voting import ElectionClosed, cast_ballot, close_ballot, record_votes
+
+UnvotedBallot = namedtuple('UnvotedBallot', ['version', 'positions', 'total_positions', 'fragment_timeout'])
+# Where the vote views send the student: back to the ballot, on once it is
+# cast, and away if it was already closed.
+BallotUrls = namedtuple('BallotUrls', ['ballot', 'done', 'voted'])
 
 
 class StudentSignUpView(CreateView):
@@ -43,7 +60,7 @@ class StudentFacultyView(UpdateView):
         return super().form_valid(form)
 
 
-@method_decorator([login_required, student_required], name='dispatch')
+@method_decorator([login_required, student_required, read_from_replica], name='dispatch')
 class ElectionListView(ListView):
     model = Election
     ordering = ('name', )
@@ -51,17 +68,29 @@ class ElectionListView(ListView):
     template_name = 'institution/students/election_list.html'
 
     def get_queryset(self):
-        student = self.request.user.student
-        student_faculty = student.faculty.values_list('pk', flat=True)
-        voted_elections = student.elections.values_list('pk', flat=True)
-        queryset = Election.objects.filter(faculty__in=student_faculty) \
-            .exclude(pk__in=voted_elections) \
-            .annotate(positions_count=Count('positions')) \
-            .filter(positions_count__gt=0)
-        return queryset
+        # Student shares its primary key with User, so the cached list can be
+        # looked up without loading the student.
+        self.student_faculties, elections = get_open_elections(self.request.user.pk)
+        return with_ballot_versions(elections)
+
+    def get_context_data(self, **kwargs):
+        kwargs['student_faculties'] = self.student_faculties
+        kwargs['fragment_timeout'] = cache_timeout(settings.FRAGMENT_CACHE_TIMEOUT)
+        return super().get_context_data(**kwargs)
 
 
-@method_decorator([login_required, student_required], name='dispatch')
+def with_ballot_versions(elections):
+    '''
+    Sets ballot_version on each election, which keys its cached row in the
+    election list.
+    '''
+    versions = get_ballot_versions([election.pk for election in elections])
+    for election in elections:
+        election.ballot_version = versions[election.pk]
+    return elections
+
+
+@method_decorator([login_required, student_required, read_from_replica], name='dispatch')
 class VotedElectionListView(ListView):
     model = VotedElection
     context_object_name = 'voted_elections'
@@ -73,6 +102,12 @@ class VotedElectionListView(ListView):
             .order_by('election__name')
         return queryset
 
+    def get_context_data(self, **kwargs):
+        # Only loaded with the profile (settings.CACHED_AUTH); the header
+        # queries the faculties otherwise.
+        kwargs['student_faculties'] = getattr(self.request.user.student, 'faculty_list', None)
+        return super().get_context_data(**kwargs)
+
 
 @login_required
 @student_required
@@ -80,28 +115,168 @@ def vote(request, pk):
     election = get_object_or_404(Election, pk=pk)
     student = request.user.student
 
-    if student.elections.filter(pk=pk).exists():
-        return render(request, 'students/voted_elections_list.html')
+    progress = get_progress(student.pk, election.pk)
+    if progress.closed:
+        messages.info(request, 'You have already voted in the %s election.' % election.name)
+        return redirect('students:voted_elections_list')
+    if election.archived:
+        messages.info(request, 'Voting in the %s election has closed.' % election.name)
+        return redirect('students:election_list')
+
+    ballot = get_unvoted_ballot(request, election, progress)
+    return vote_step(request, election, student, ballot, student_urls(election))
+
+
+def student_urls(election):
+    return BallotUrls(
+        reverse('students:vote', args=[election.pk]),
+        reverse('students:election_list'),
+        reverse('students:voted_elections_list'))
+
+
+def token_vote(request, token):
+    '''
+    The ballot, opened with a voting token instead of a login (see
+    institution/tokens.py). The session and user tables are never touched,
+    even when the browser also has a login session.
+    '''
+    if not settings.VOTING_TOKENS:
+        raise Http404('Voting tokens are turned off.')
+    # Templates would otherwise load the session's user to show who is
+    # logged in.
+    request.user = AnonymousUser()
+    sessionless()
+    try:
+        student_id, election_id = tokens.check_token(token)
+    except (signing.BadSignature, ValueError):
+        raise Http404('Unknown voting token.')
+    election = get_object_or_404(Election, pk=election_id)
+    # The token vouches for the student; votes only need their primary key.
+    student = Student(user_id=student_id)
+
+    progress = get_progress(student.pk, election.pk)
+    if progress.closed or election.archived:
+        return render(request, 'institution/students/token_voted.html', {
+            'election': election,
+            'voted': progress.closed,
+        })
+
+    url = request.path
+    ballot = get_unvoted_ballot(request, election, progress)
+    return vote_step(request, election, student, ballot, BallotUrls(url, url, url))
+
+
+def get_unvoted_ballot(request, election, progress):
+    '''
+    An UnvotedBallot with the positions the student's BallotProgress says
+    they still have to vote for. Votes are checked against the primary's
+    snapshot: saving one for a candidate that is gone would fail like a
+    second vote.
+    '''
+    with replica_reads() if request.method != 'POST' else nullcontext():
+        ballot = get_ballot(election.pk)
+        # Forms rendered from a snapshot read on the replica may be stale too.
+        fragment_timeout = cache_timeout(settings.FRAGMENT_CACHE_TIMEOUT)
+    positions = [position for position in ballot.positions if position.pk not in progress.voted_positions]
+    return UnvotedBallot(ballot.version, positions, len(ballot.positions), fragment_timeout)
+
+
+def vote_step(request, election, student, ballot, urls):
+    if settings.BALLOT_MODE == 'full':
+        return vote_ballot(request, election, student, ballot, urls)
+    return vote_position(request, election, student, ballot, urls)
+
+
+def vote_ballot(request, election, student, ballot, urls):
+    '''
+    Full-ballot mode: every position the student has not voted for yet is
+    on one form, and the whole ballot is saved in a single transaction.
+    '''
+    if settings.VOTE_INGESTION == 'journal' and journal.is_pending(student.pk, election.pk):
+        messages.info(request, 'Your ballot for the %s election is being counted.' % election.name)
+        return redirect(urls.done)
+
+    if request.method == 'POST':
+        form = BallotForm(positions=ballot.positions, data=request.POST)
+        if form.is_valid():
+            if settings.VOTE_INGESTION == 'journal':
+                return submit_ballot(request, election, student, form.get_candidates(), urls)
+            try:
+                cast_ballot(student, election, form.get_candidates())
+            except IntegrityError:
+                # A second submit of the same ballot lost the race.
+                invalidate_progress(student.pk, election.pk)
+                messages.info(request, 'You have already voted in the %s election.' % election.name)
+                return redirect(urls.voted)
+            except ElectionClosed:
+                messages.info(request, 'Voting in the %s election has closed.' % election.name)
+                return redirect(urls.done)
+            messages.success(request, 'Congratulations! You voted in the %s election successfully!' % (election.name))
+            return redirect(urls.done)
+    else:
+        form = BallotForm(positions=ballot.positions)
+
+    return render(request, 'institution/students/ballot_form.html', {
+        'election': election,
+        'form': form,
+        'ballot': ballot,
+        'position_ids': '-'.join(str(position.pk) for position in ballot.positions),
+    })
+
+
+def submit_ballot(request, election, student, candidates, urls):
+    '''
+    Journal mode: hands the ballot to the journal writer and confirms it
+    once it is saved.
+    '''
+    outcome = journal.submit(student, election, candidates)
+    if outcome == journal.QUEUED:
+        messages.info(request, 'Your ballot for the %s election has been received and will be counted shortly.' % (
+            election.name))
+        return redirect(urls.done)
+    if outcome in (journal.DUPLICATE, journal.REJECTED):
+        invalidate_progress(student.pk, election.pk)
+    if outcome == journal.DUPLICATE:
+        messages.info(request, 'You have already voted in the %s election.' % election.name)
+        return redirect(urls.voted)
+    if outcome == journal.REJECTED:
+        messages.error(request, 'The %s election changed while you were voting. Please vote again.' % election.name)
+        return redirect(urls.ballot)
+    messages.success(request, 'Congratulations! You voted in the %s election successfully!' % (election.name))
+    return redirect(urls.done)
+
+
+def vote_position(request, election, student, ballot, urls):
+    '''
+    Wizard mode: one position per request, in alphabetical order.
+    '''
+    if not ballot.positions:
+        return vote_ballot(request, election, student, ballot, urls)
 
-    total_positions = election.positions.count()
-    unvoted_positions = student.get_unvoted_positions(election)
-    total_unvoted_positions = unvoted_positions.count()
-    progress = 100 - round(((total_unvoted_positions - 1) / total_positions) * 100)
-    position = unvoted_positions.first()
+    total_unvoted_positions = len(ballot.positions)
+    progress = 100 - round(((total_unvoted_positions - 1) / ballot.total_positions) * 100)
+    position = ballot.positions[0]
 
     if request.method == 'POST':
         form = VoteForm(position=position, data=request.POST)
         if form.is_valid():
-            with transaction.atomic():
-                student_vote = form.save(commit=False)
-                student_vote.student = student
-                student_vote.save()
-                if student.get_unvoted_positions(election).exists():
-                    return redirect('students:vote', pk)
-                else:
-                    VotedElection.objects.create(student=student, election=election)
-                    messages.success(request, 'Congratulations! You voted in the %s election successfully!' % (election.name))
-                    return redirect('students:election_list')
+            try:
+                with transaction.atomic():
+                    record_votes(student, election, [form.get_candidate()])
+                    if total_unvoted_positions == 1:
+                        close_ballot(student, election)
+            except IntegrityError:
+                # A repeated submit for a position that was already saved;
+                # start again from whatever is still unvoted.
+                invalidate_progress(student.pk, election.pk)
+                return redirect(urls.ballot)
+            except ElectionClosed:
+                messages.info(request, 'Voting in the %s election has closed.' % election.name)
+                return redirect(urls.done)
+            if total_unvoted_positions > 1:
+                return redirect(urls.ballot)
+            messages.success(request, 'Congratulations! You voted in the %s election successfully!' % (election.name))
+            return redirect(urls.done)
     else:
         form = VoteForm(position=position)
 
@@ -109,5 +284,6 @@ def vote(request, pk):
         'election': election,
         'position': position,
         'form': form,
+        'ballot': ballot,
         'progress': progress
     })
@@ -0,0 +1,94 @@
+'''
+Async versions of the student voting views, used when the project is served
+through digital-voting/asgi.py (settings.ASYNC_STUDENT_VIEWS).
+
+Django 3.1's ORM is synchronous, so every database access goes through
+sync_to_async. thread_sensitive=False lets those calls run side by side in
+the executor's threads instead of queueing behind Django's single sync
+thread. Each executor thread has its own database connection. The request
+signals only close the handler thread's connections, so db() closes the
+executor thread's connection after each call as they would (honouring
+CONN_MAX_AGE).
+
+Because the queries run in other threads, REQUEST_STATS only counts the
+queries and template time of the handler thread for these views, which
+is close to none of them.
+'''
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import messages
+from django.contrib.auth import views as auth_views
+from django.db import close_old_connections
+from django.shortcuts import get_object_or_404, redirect, render
+
+from ..decorators import async_student_required
+from ..eligibility import get_open_elections
+from ..models import Election, VotedElection
+from ..progress import get_progress
+from ..routers import cache_timeout, read_from_replica
+from .students import get_unvoted_ballot, student_urls, vote_step, with_ballot_versions
+
+
+def db(func):
+    @wraps(func)
+    def call(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return sync_to_async(call, thread_sensitive=False)
+
+
+_login = auth_views.LoginView.as_view()
+
+
+async def login(request, *args, **kwargs):
+    # Checking the password waits for a PBKDF2 hash. In Django's single sync
+    # thread that wait would hold up every other sync view.
+    return await db(_login)(request, *args, **kwargs)
+
+
+@async_student_required
+@read_from_replica
+async def election_list(request):
+    faculties, elections = await db(get_open_elections)(request.user.pk)
+    elections = await db(with_ballot_versions)(elections)
+    # Rendering reads the session for messages, so it runs in a thread too.
+    return await db(render)(request, 'institution/students/election_list.html', {
+        'elections': elections,
+        'student_faculties': faculties,
+        'fragment_timeout': cache_timeout(settings.FRAGMENT_CACHE_TIMEOUT),
+    })
+
+
+@async_student_required
+@read_from_replica
+async def voted_elections_list(request):
+    voted_elections = VotedElection.objects.filter(student=request.user.pk) \
+        .select_related('election', 'election__faculty') \
+        .order_by('election__name')
+    student = await db(getattr)(request.user, 'student')
+    return await db(render)(request, 'institution/students/voted_elections_list.html', {
+        'voted_elections': await db(list)(voted_elections),
+        'student_faculties': getattr(student, 'faculty_list', None),
+    })
+
+
+@async_student_required
+async def vote(request, pk):
+    election = await db(get_object_or_404)(Election, pk=pk)
+    student = await db(getattr)(request.user, 'student')
+
+    progress = await db(get_progress)(student.pk, election.pk)
+    if progress.closed:
+        messages.info(request, 'You have already voted in the %s election.' % election.name)
+        return redirect('students:voted_elections_list')
+    if election.archived:
+        messages.info(request, 'Voting in the %s election has closed.' % election.name)
+        return redirect('students:election_list')
+
+    ballot = await db(get_unvoted_ballot)(request, election, progress)
+    # Validating the form is CPU only, but saving and rendering are not.
+    return await db(vote_step)(request, election, student, ballot, student_urls(election))
@@ -0,0 +1,98 @@
+'''
+Write path for ballots. Every way a vote reaches the database goes through
+these helpers so the raw votes, the tallies, the voted flag and the vote
+ledger stay in step.
+'''
+from django.db import connection, transaction
+
+from . import ledger, progress
+from .live import publisher
+from .models import CandidateTally, Election, StudentVote, TurnoutCount, VotedElection
+
+
+class ElectionClosed(Exception):
+    '''
+    The election was archived while the vote was being saved.
+    '''
+
+
+def check_open(election_ids):
+    '''
+    Raises ElectionClosed if any of the elections is archived. Call it inside
+    the vote's transaction, after its writes: the election rows are locked
+    (the write lock is already held on SQLite), so archive_election() either
+    sees the votes or has archived the election before they are saved.
+    '''
+    elections = Election.objects.filter(pk__in=election_ids).order_by('pk')
+    if connection.features.has_select_for_update:
+        elections = elections.select_for_update()
+    if any(elections.values_list('archived', flat=True)):
+        raise ElectionClosed
+
+
+def _save_votes(student, election, candidates):
+    votes = StudentVote.objects.bulk_create([
+        StudentVote(
+            student=student,
+            candidate_id=candidate.pk,
+            position_id=candidate.position_id,
+            election_id=election.pk)
+        for candidate in candidates
+    ])
+    candidate_ids = [candidate.pk for candidate in candidates]
+    position_ids = [candidate.position_id for candidate in candidates]
+    CandidateTally.objects.increment(candidate_ids)
+    transaction.on_commit(lambda: publisher.record(election.pk, candidate_ids=candidate_ids))
+    transaction.on_commit(lambda: progress.record(student.pk, election.pk, position_ids=position_ids))
+    return votes
+
+
+def _close(student, election):
+    voted_election = VotedElection.objects.create(student=student, election=election)
+    TurnoutCount.objects.increment([voted_election])
+    transaction.on_commit(lambda: publisher.record(election.pk, voters=1))
+    transaction.on_commit(lambda: progress.record(student.pk, election.pk, closed=True))
+    return voted_election
+
+
+def _ledger_votes(candidates):
+    return [(candidate.position_id, candidate.pk) for candidate in candidates]
+
+
+def record_votes(student, election, candidates):
+    '''
+    Saves one StudentVote per candidate and bumps their tallies. Candidates
+    may be model instances or ballot snapshot entries. Must run inside a
+    transaction. Raises ElectionClosed if the election has been archived.
+    '''
+    candidates = list(candidates)
+    votes = _save_votes(student, election, candidates)
+    ledger.append(election.pk, [(student.pk, _ledger_votes(candidates), False)])
+    check_open([election.pk])
+    return votes
+
+
+def close_ballot(student, election):
+    '''
+    Marks the election as voted for the student. Must run inside the
+    transaction that saved the student's last vote.
+    '''
+    voted_election = _close(student, election)
+    ledger.append(election.pk, [(student.pk, [], True)])
+    check_open([election.pk])
+    return voted_election
+
+
+@transaction.atomic
+def cast_ballot(student, election, candidates):
+    '''
+    Saves a complete ballot (one candidate per position) in a single
+    transaction, as one ledger entry. Raises ElectionClosed if the election
+    has been archived.
+    '''
+    candidates = list(candidates)
+    _save_votes(student, election, candidates)
+    voted_election = _close(student, election)
+    ledger.append(election.pk, [(student.pk, _ledger_votes(candidates), True)])
+    check_open([election.pk])
+    return voted_election
@@ -0,0 +1,24 @@
+'''
+Process pools for CPU-bound work: the bulk commands' password hashing and
+image rendering, and login password hashing (institution.hashers).
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+
+
+def init_worker(settings_module):
+    # Spawned workers (macOS/Windows, or a spawn context) start without
+    # Django configured.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    django.setup()
+
+
+def process_pool(max_workers, **kwargs):
+    '''
+    A ProcessPoolExecutor whose workers set Django up with this process's
+    settings.
+    '''
+    return ProcessPoolExecutor(max_workers, initializer=init_worker,
+                               initargs=(os.environ['DJANGO_SETTINGS_MODULE'], ), **kwargs)